@@ -4,12 +4,13 @@
 import re
 import pandas as pd
 from pathlib import Path
+from columnar_output import read_run
 
 INPUT_DIR = Path(r'C:\Users\milad\Desktop\test1_csv')
 OUTPUT_FILE = "training_dataset_idle.csv"
 
 def parse_filename(filename):
-    stem = filename.stem
+    stem = filename.name.split('.')[0]  # Also strips .csv.gz / .csv.zst / .npyd
     parts = stem.split('_')
 
     mode = parts[0] if len(parts) > 0 else ""
@@ -43,19 +44,33 @@ def aggregate_metrics(df):
 
     return mean_power, mean_freq, mean_util, mean_latency
 
+def cstate_time_budget_ms(df):
+    # Total CPU time a run's C-state residencies can add up to: run duration times CPU count.
+    # Runs stop early once converged, so the duration is taken from the file itself; each row's
+    # residency deltas cover one sampling interval, so n rows span n intervals, not n - 1
+    timestamps = pd.to_datetime(df['Timestamp'])
+    rows = len(timestamps)
+    if rows < 2:
+        return 0.0
+    duration_ms = (timestamps.iloc[-1] - timestamps.iloc[0]).total_seconds() * 1000 * rows / (rows - 1)
+    cpus = {m.group(1) for m in (re.match(r'CPU(\d+)_', col) for col in df.columns) if m}
+    return duration_ms * len(cpus)
+
 def main():
     all_rows = []
 
-    csv_files = list(INPUT_DIR.glob("*.csv"))
+    # Runs logged with --format npy are directories named *.npyd, --compress adds .gz/.zst
+    csv_files = [path for pattern in ("*.csv", "*.csv.gz", "*.csv.zst", "*.npyd")
+                 for path in INPUT_DIR.glob(pattern)]
     print(f"Found {len(csv_files)} files.")
 
     for csv_file in csv_files:
         mode, governor, pstate_pref, enabled_cstates = parse_filename(csv_file)
         try:
-            df = pd.read_csv(csv_file)
+            df = read_run(csv_file)
 
             mean_power, mean_freq, mean_util, mean_latency = aggregate_metrics(df)
-            first_timestamp = df['Timestamp'].iloc[0] if 'Timestamp' in df.columns else None
+            first_timestamp = pd.to_datetime(df['Timestamp'].iloc[0]) if 'Timestamp' in df.columns else None
 
             # ---- Sum C-state times per state across all cores ----
             cstate_sums = {}
@@ -76,14 +91,17 @@ def main():
                 'mean_util': mean_util,
                 'mean_latency_ms': mean_latency
             }
+            if 'Logger_Energy_Share_W' in df.columns:
+                # Runs logged with --self-overhead: the monitor's own share, and package power net of it
+                logger_share = df['Logger_Energy_Share_W'].mean()
+                row['mean_logger_share_w'] = logger_share
+                row['mean_power_pkg_net_w'] = mean_power - logger_share
 
             ordered_cstates = ['POLL', 'C1', 'C1E', 'C3', 'C6', 'C7s', 'C8', 'C9', 'C10']
-            test_duration_ms = 59000  # 60 seconds in milliseconds
-            num_cores = 8
-            total_possible_time = test_duration_ms * num_cores
+            total_possible_time = cstate_time_budget_ms(df)
 
             for cstate in ordered_cstates:
-                if cstate in cstate_sums:
+                if cstate in cstate_sums and total_possible_time > 0:
                     row[f'percent_{cstate}'] = (cstate_sums[cstate] / total_possible_time) * 100
                 else:
                     row[f'percent_{cstate}'] = 0.0
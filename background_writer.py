@@ -0,0 +1,125 @@
+### Dedicated writer thread between the sampling loop and its output sink ###
+import os
+import queue
+import resource
+import tempfile
+import threading
+
+import numpy as np
+
+POLICIES = ("block", "drop", "spill")
+
+
+class BackgroundWriter:
+    """Feeds record chunks to a sink (CsvSink, NpyChunkWriter, ...) from its own thread.
+
+    The sampling thread only enqueues; formatting, compression and disk I/O
+    happen on the writer thread. When the bounded queue is full the policy
+    decides what the sampler does:
+      block  wait for room (no data loss, sampling may stall)
+      drop   discard the chunk and count its rows
+      spill  append the chunk to a temporary .npy spill file; once the queue
+             drains the writer replays the spill file in order
+    """
+
+    def __init__(self, sink, max_chunks=64, policy="block", spill_dir=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy!r}, expected one of {POLICIES}")
+        self.sink = sink
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.max_depth = 0
+        self.written_rows = 0
+        self.dropped_rows = 0
+        self.spilled_rows = 0
+        self.error = None
+        self.rusage = None          # This thread's getrusage after its latest write
+        self._spill = None          # Open spill file while spilling
+        self._spill_chunks = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="sample-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def write(self, records):
+        """Called on the sampling thread with a chunk it no longer touches."""
+        if len(records) == 0:
+            return
+        if self.policy == "spill":
+            with self._lock:
+                if self._spill is not None:
+                    self._spill_chunk(records)
+                    return
+                try:
+                    self.queue.put_nowait(records)
+                except queue.Full:
+                    self._spill_chunk(records)
+                    return
+        elif self.policy == "drop":
+            try:
+                self.queue.put_nowait(records)
+            except queue.Full:
+                self.dropped_rows += len(records)
+                return
+        else:
+            self.queue.put(records)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _spill_chunk(self, records):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix="rapl-spill-", suffix=".npy", dir=self.spill_dir)
+        np.save(self._spill, records)
+        self._spill_chunks += 1
+        self.spilled_rows += len(records)
+
+    def _write(self, records):
+        try:
+            self.sink.write(records)
+            self.written_rows += len(records)
+            self.rusage = resource.getrusage(resource.RUSAGE_THREAD)
+        except Exception as exc:  # Keep draining so the sampler never blocks on a dead writer
+            if self.error is None:
+                self.error = exc
+
+    def _replay_spill(self):
+        # Everything queued before spilling started has been written; take the spill file over
+        with self._lock:
+            spill, chunks = self._spill, self._spill_chunks
+            self._spill, self._spill_chunks = None, 0
+        if spill is None:
+            return
+        spill.seek(0)
+        for _ in range(chunks):
+            self._write(np.load(spill))
+        spill.close()
+
+    def _run(self):
+        while True:
+            try:
+                records = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+            if records is None:
+                self._replay_spill()
+                return
+            self._write(records)
+            if self.queue.empty():
+                self._replay_spill()
+
+    def close(self):
+        """Drain the queue and any spill file, then close the sink."""
+        self.queue.put(None)
+        self._thread.join()
+        self.sink.close()
+        if self.error is not None:
+            raise self.error
+
+
+def spill_dir_for(path):
+    # Spill next to the output so it lands on the same filesystem
+    return os.path.dirname(os.path.abspath(path)) or None
@@ -0,0 +1,211 @@
+### Sampler hot-path benchmark on synthetic hosts: per-tick latency, syscalls and allocations ###
+# Also scrapes the embedded metrics exporter over loopback and checks the OpenMetrics output.
+#
+#   python3 bench_sampler.py                          # 8/64/256/512 CPUs
+#   python3 bench_sampler.py --save bench.json        # record a baseline
+#   python3 bench_sampler.py --baseline bench.json    # exit 1 if anything regressed
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import rapl_power_monitoring_full as logger
+from fake_sysfs import FakeHost
+from metrics_exporter import MetricsExporter, MetricsServer
+from sample_store import SampleRing
+from sysfs_pool import SysfsFilePool
+
+# Metrics compared against a baseline; all of them are "lower is better"
+GATED_METRICS = ["tick_p50_us", "tick_p99_us", "syscalls_per_tick", "alloc_bytes_per_tick", "format_us_per_row",
+                 "publish_us", "scrape_us"]
+
+
+def build_sampler(root):
+    args = logger.build_parser().parse_args(["--root", root, "--no-probe"])
+    pool = SysfsFilePool()
+    reader = logger.RaplReader(pool, logger.find_rapl_domains(root))
+    cpu_cores = logger.get_cpu_cores(root)
+    collectors, schema, row, _ = logger.setup_collectors(args, pool, reader, cpu_cores)
+    return pool, collectors, schema, row
+
+
+def tick(collectors, row, ring, now):
+    # Every collector due at once: the worst-case tick of the multi-rate loop
+    for collector in collectors:
+        collector.sample(now)
+    row["timestamp"] = time.time()
+    ring.append(row)
+    for collector in collectors:
+        if not collector.forward_fill:
+            collector.clear()
+
+
+def check_openmetrics(body):
+    """Raise ValueError unless body is well-formed OpenMetrics text with at least one sample."""
+    text = body.decode()
+    if not text.endswith("# EOF\n"):
+        raise ValueError("exporter output does not end with # EOF")
+    samples = 0
+    for line in text.splitlines()[:-1]:
+        if line.startswith("# TYPE ") or line.startswith("# HELP "):
+            continue
+        name, _, value = line.rpartition(" ")
+        if not name or "{" in name and not name.endswith("}"):
+            raise ValueError(f"malformed sample line {line!r}")
+        float(value)
+        samples += 1
+    if not samples:
+        raise ValueError("exporter output has no samples")
+    return samples
+
+
+def bench_exporter(schema, records, scrapes=200):
+    """Per-row publish cost, and loopback scrape round trips (first render and cached)."""
+    exporter = MetricsExporter(schema)
+    server = MetricsServer(exporter, "127.0.0.1:0")
+    host, port = server.address.split(":")
+    try:
+        start = time.perf_counter_ns()
+        for record in records:
+            exporter.publish(record)
+        publish_us = (time.perf_counter_ns() - start) / 1000 / max(len(records), 1)
+
+        connection = http.client.HTTPConnection(host, int(port))
+        durations = np.zeros(scrapes)
+        for i in range(scrapes):
+            start = time.perf_counter_ns()
+            connection.request("GET", "/metrics")
+            body = connection.getresponse().read()
+            durations[i] = (time.perf_counter_ns() - start) / 1000
+            connection.close()  # HTTP/1.0 server: one request per connection
+        check_openmetrics(body)
+    finally:
+        server.close()
+    return publish_us, float(durations[0]), float(np.median(durations[1:]))
+
+
+def bench_host(cpus, ticks, workdir):
+    host = FakeHost(os.path.join(workdir, f"host{cpus}"), cpus).build()
+    pool, collectors, schema, row = build_sampler(host.root)
+    ring = SampleRing(schema.dtype, ticks + 1)
+
+    for _ in range(5):  # Warm up descriptors and caches
+        host.advance(0.5)
+        tick(collectors, row, ring, time.monotonic())
+
+    durations = np.zeros(ticks)
+    syscalls = np.zeros(ticks)
+    for i in range(ticks):
+        host.advance(0.5)
+        syscalls_start = pool.syscalls
+        start = time.perf_counter_ns()
+        tick(collectors, row, ring, time.monotonic())
+        durations[i] = (time.perf_counter_ns() - start) / 1000
+        syscalls[i] = pool.syscalls - syscalls_start
+
+    # Allocation pass, separate so tracemalloc overhead does not skew the timings
+    alloc_bytes = np.zeros(ticks)
+    retained_blocks = np.zeros(ticks)
+    tracemalloc.start()
+    for i in range(ticks):
+        host.advance(0.5)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        blocks = sys.getallocatedblocks()
+        tick(collectors, row, ring, time.monotonic())
+        _, peak = tracemalloc.get_traced_memory()
+        alloc_bytes[i] = peak - current
+        retained_blocks[i] = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    records = ring.take_pending()
+    start = time.perf_counter_ns()
+    schema.format_csv(records)
+    format_us = (time.perf_counter_ns() - start) / 1000 / max(len(records), 1)
+    publish_us, first_scrape_us, scrape_us = bench_exporter(schema, records)
+
+    pool.close()
+    return {
+        "cpus": cpus,
+        "columns": len(schema.columns),
+        "tick_p50_us": float(np.percentile(durations, 50)),
+        "tick_p99_us": float(np.percentile(durations, 99)),
+        "tick_max_us": float(durations.max()),
+        "syscalls_per_tick": float(syscalls.mean()),
+        "alloc_bytes_per_tick": float(np.median(alloc_bytes)),
+        "retained_blocks_per_tick": float(np.median(retained_blocks)),
+        "format_us_per_row": format_us,
+        "publish_us": publish_us,
+        "first_scrape_us": first_scrape_us,
+        "scrape_us": scrape_us,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of metrics that are worse than baseline by more than tolerance."""
+    regressions = []
+    by_cpus = {entry["cpus"]: entry for entry in baseline}
+    for result in results:
+        reference = by_cpus.get(result["cpus"])
+        if reference is None:
+            continue
+        for metric in GATED_METRICS:
+            if metric not in reference:
+                continue
+            limit = reference[metric] * (1 + tolerance)
+            # Small absolute slack so near-zero metrics do not flap
+            if result[metric] > limit and result[metric] - reference[metric] > 1.0:
+                regressions.append(f"{result['cpus']} CPUs {metric}: {result[metric]:.1f} > "
+                                   f"{reference[metric]:.1f} (+{tolerance:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sampler hot path on fake sysfs trees")
+    parser.add_argument("--cpus", type=int, nargs="+", default=[8, 64, 256, 512])
+    parser.add_argument("--ticks", type=int, default=50, help="Measured ticks per host size")
+    parser.add_argument("--save", help="Write the results as JSON (a future baseline)")
+    parser.add_argument("--baseline", help="JSON results to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative slowdown against the baseline (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="fake-sysfs-") as workdir:
+        print(f"{'CPUs':>5} {'cols':>6} {'p50 us':>9} {'p99 us':>9} {'max us':>9} "
+              f"{'sys/tick':>9} {'alloc B':>9} {'blocks':>7} {'fmt us/row':>10} "
+              f"{'pub us':>7} {'scrape1':>8} {'scrape':>7}")
+        for cpus in args.cpus:
+            result = bench_host(cpus, args.ticks, workdir)
+            results.append(result)
+            print(f"{cpus:>5} {result['columns']:>6} {result['tick_p50_us']:>9.1f} {result['tick_p99_us']:>9.1f} "
+                  f"{result['tick_max_us']:>9.1f} {result['syscalls_per_tick']:>9.1f} "
+                  f"{result['alloc_bytes_per_tick']:>9.0f} {result['retained_blocks_per_tick']:>7.0f} "
+                  f"{result['format_us_per_row']:>10.1f} {result['publish_us']:>7.1f} "
+                  f"{result['first_scrape_us']:>8.0f} {result['scrape_us']:>7.0f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results saved in {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+### Chunked columnar .npy output for the RAPL logger and the matching zero-copy reader ###
+#
+# A run is a directory (conventionally named *.npyd) holding:
+#   schema.json                  fields (name, dtype, shape) and CSV columns of the sample rows
+#   chunk-000000.<field>.npy     one typed array per field per chunk, rows in time order
+#
+# Every chunk file is a plain .npy, so readers memory-map it with np.load(mmap_mode="r").
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from sample_store import Schema
+
+SCHEMA_FILE = "schema.json"
+
+
+class NpyChunkWriter:
+    """Accumulates flushed records and writes them as one .npy file per field every chunk_rows rows."""
+
+    def __init__(self, path, schema, chunk_rows=4096):
+        self.path = path
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.chunks = 0
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, SCHEMA_FILE), "w") as f:
+            json.dump({
+                "version": 1,
+                "fields": [[name, np.dtype(dtype).str, list(shape)] for name, dtype, shape in schema.fields],
+                "columns": [list(column) for column in schema.columns],
+            }, f, indent=1)
+
+    def write(self, records):
+        if len(records) == 0:
+            return
+        self.pending.append(records)
+        self.pending_rows += len(records)
+        if self.pending_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_rows:
+            return
+        records = np.concatenate(self.pending)
+        prefix = os.path.join(self.path, f"chunk-{self.chunks:06d}")
+        for name, _, _ in self.schema.fields:
+            # Write under a temporary name so readers never see a half-written chunk
+            tmp_path = f"{prefix}.{name}.npy.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(records[name]))
+            os.replace(tmp_path, f"{prefix}.{name}.npy")
+        self.chunks += 1
+        self.pending.clear()
+        self.pending_rows = 0
+
+    def close(self):
+        self.flush()
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        meta = json.load(f)
+    schema = Schema()
+    schema.fields = [(name, dtype, tuple(shape)) for name, dtype, shape in meta["fields"]]
+    schema.columns = [tuple(column) for column in meta["columns"]]
+    return schema
+
+
+def iter_chunks(path, fields=None):
+    """Yield {field: memory-mapped array} per chunk, oldest first, without copying."""
+    schema = read_schema(path)
+    names = [name for name, _, _ in schema.fields] if fields is None else list(fields)
+    chunk = 0
+    while True:
+        prefix = os.path.join(path, f"chunk-{chunk:06d}")
+        files = [f"{prefix}.{name}.npy" for name in names]
+        if not all(os.path.isfile(file) for file in files):
+            return
+        yield {name: np.load(file, mmap_mode="r") for name, file in zip(names, files)}
+        chunk += 1
+
+
+def load_fields(path, fields=None):
+    """{field: array} for the whole run; a single-chunk run is returned memory-mapped, as is."""
+    chunks = list(iter_chunks(path, fields))
+    if not chunks:
+        schema = read_schema(path)
+        return {name: np.zeros((0,) + tuple(shape), dtype=dtype) for name, dtype, shape in schema.fields
+                if fields is None or name in fields}
+    if len(chunks) == 1:
+        return chunks[0]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def compact_run(path):
+    """Merge a closed run's chunks into a single chunk per field (fewer files, same rows)."""
+    chunks = list(iter_chunks(path))
+    if len(chunks) <= 1:
+        return
+    merged = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    count = len(chunks)
+    del chunks  # Release the mappings before the files are replaced
+    prefix = os.path.join(path, "chunk-000000")
+    for name, values in merged.items():
+        with open(f"{prefix}.{name}.npy.tmp", "wb") as f:
+            np.save(f, values)
+    for name in merged:
+        os.replace(f"{prefix}.{name}.npy.tmp", f"{prefix}.{name}.npy")
+    for chunk in range(1, count):
+        for name in merged:
+            os.remove(os.path.join(path, f"chunk-{chunk:06d}.{name}.npy"))
+
+
+def load_dataframe(path):
+    """The run as a pandas DataFrame with the same column names as the CSV output."""
+    import pandas as pd
+
+    schema = read_schema(path)
+    data = load_fields(path)
+    timestamps = np.asarray(data["timestamp"])
+    columns = {}
+    if len(timestamps):
+        # Local wall time, like the CSV Timestamp column
+        first = float(timestamps[0])
+        utc_offset = datetime.fromtimestamp(first) - datetime.fromtimestamp(first, timezone.utc).replace(tzinfo=None)
+        columns["Timestamp"] = pd.to_datetime(timestamps, unit="s") + utc_offset
+    else:
+        columns["Timestamp"] = pd.to_datetime(timestamps, unit="s")
+    for header, field, index, _, _ in schema.columns:
+        values = data[field]
+        values = values if index is None else values[:, index]
+        if values.dtype.kind == "S":
+            values = values.astype(str)  # Fixed-width ASCII fields, e.g. governor names
+        columns[header] = values
+    return pd.DataFrame(columns)
+
+
+def read_run(path):
+    """Load a logger run saved either as CSV or as a .npyd directory."""
+    import pandas as pd
+
+    if os.path.isdir(path):
+        return load_dataframe(path)
+    return pd.read_csv(path)
+
+
+def export_csv(path, output):
+    """Write a .npyd run out as CSV, in the same layout the logger writes."""
+    schema = read_schema(path)
+    with open(output, "w") as f:
+        f.write(",".join(schema.header) + "\n")
+        for chunk in iter_chunks(path):
+            records = np.empty(len(chunk["timestamp"]), dtype=schema.dtype)
+            for name in chunk:
+                records[name] = chunk[name]
+            f.write(schema.format_csv(records))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a .npyd logger run as CSV")
+    parser.add_argument("run", help="Run directory written with --format npy")
+    parser.add_argument("-o", "--output", help="Output CSV file (default: <run>.csv)")
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.run.rstrip(os.sep))[0] + ".csv"
+    export_csv(args.run, output)
+    print(f"Exported {args.run} to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+### Applies sweep configurations (intel_pstate mode, governor, EPP, enabled C-states) with direct sysfs writes ###
+#
+# The (cpu, state name) -> disable file map and the per-CPU cpufreq files are
+# found once. Applying a configuration reads the current values (one pread
+# each through a persistent descriptor), writes only those that differ and
+# reads them back. The EPP value "default" is the exception: intel_pstate
+# reads it back as the preference it resolved to, so it is always written and
+# any valid preference is accepted. Writing sysfs needs root, as the sudo tee
+# calls did.
+import os
+
+from sysfs_pool import SysfsFilePool
+
+
+class ConfigApplier:
+    """Diff-based writer for the sysfs knobs a sweep configuration consists of."""
+
+    def __init__(self, root="/"):
+        self.cpu_dir = os.path.join(root, "sys/devices/system/cpu")
+        self.status_path = os.path.join(self.cpu_dir, "intel_pstate", "status")
+        self.pool = SysfsFilePool()
+        self.writes = 0
+        self._scan_cpuidle()
+        self._scan_cpufreq()
+
+    def _cpus(self):
+        entries = [entry for entry in os.listdir(self.cpu_dir) if entry[3:].isdigit() and entry.startswith("cpu")]
+        return sorted(entries, key=lambda entry: int(entry[3:]))
+
+    def _scan_cpuidle(self):
+        self.disable_paths = {}  # state name -> disable file of every CPU that has it
+        for cpu in self._cpus():
+            cpuidle = os.path.join(self.cpu_dir, cpu, "cpuidle")
+            try:
+                state_dirs = os.listdir(cpuidle)
+            except OSError:
+                continue
+            for state_dir in state_dirs:
+                if not state_dir.startswith("state"):
+                    continue
+                name = self.pool.read(os.path.join(cpuidle, state_dir, "name"))
+                if name is not None:
+                    self.disable_paths.setdefault(name, []).append(os.path.join(cpuidle, state_dir, "disable"))
+
+    def _scan_cpufreq(self):
+        # Rescanned after a mode switch: intel_pstate recreates the policies, and EPP only exists in active mode
+        self.governor_paths = []
+        self.epp_paths = []
+        for cpu in self._cpus():
+            cpufreq = os.path.join(self.cpu_dir, cpu, "cpufreq")
+            if os.path.isfile(os.path.join(cpufreq, "scaling_governor")):
+                self.governor_paths.append(os.path.join(cpufreq, "scaling_governor"))
+            if os.path.isfile(os.path.join(cpufreq, "energy_performance_preference")):
+                self.epp_paths.append(os.path.join(cpufreq, "energy_performance_preference"))
+        for path in self.governor_paths + self.epp_paths:
+            self.pool.discard(path)  # Descriptors may point at policies that no longer exist
+
+    def _changes(self, targets):
+        """The (path, value) pairs of targets whose current value differs."""
+        return [(path, value) for path, value in targets if self.pool.read(path) != value]
+
+    def _resolved_epp(self, path, actual):
+        """True if actual is what an EPP file may read back after writing "default"."""
+        if actual is None:
+            return False
+        # The kernel resolves "default" to the firmware's preference: a named one or a raw 0-255 value
+        available = self.pool.read(os.path.join(os.path.dirname(path), "energy_performance_available_preferences"))
+        return actual.isdigit() or actual in (available or "").split()
+
+    def _write(self, changes, accept=None):
+        failed = []
+        for path, value in changes:
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+                try:
+                    os.write(fd, value.encode())
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                failed.append(f"{path}: {e.strerror}")
+                continue
+            self.writes += 1
+            actual = self.pool.read(path)  # Verify: the kernel may refuse a value without failing the write
+            if actual != value and not (accept and accept(path, actual)):
+                failed.append(f"{path}: reads {actual!r}, wanted {value!r}")
+        if failed:
+            raise RuntimeError("Could not apply configuration:\n  " + "\n  ".join(failed))
+        return len(changes)
+
+    def apply(self, status=None, governor=None, epp=None, cstates=None):
+        """Apply the given settings (None leaves one as is); return the number of files written.
+
+        cstates is the collection of state names to enable, every other state
+        is disabled. Raises RuntimeError if a write fails or does not read back.
+        """
+        written = 0
+        if status is not None:
+            written += self._write(self._changes([(self.status_path, status)]))
+            if written:
+                self._scan_cpufreq()
+        if governor is not None:
+            written += self._write(self._changes([(path, governor) for path in self.governor_paths]))
+        if epp is not None:
+            targets = [(path, epp) for path in self.epp_paths]
+            if epp == "default":
+                # Never reads back as "default", so it cannot be diffed: always written
+                written += self._write(targets, accept=self._resolved_epp)
+            else:
+                written += self._write(self._changes(targets))
+        if cstates is not None:
+            enabled = set(cstates)
+            targets = [(path, "0" if name in enabled else "1")
+                       for name, paths in self.disable_paths.items() for path in paths]
+            written += self._write(self._changes(targets))
+        return written
+
+    def close(self):
+        self.pool.close()
@@ -1,10 +1,12 @@
 ########### This code automates the logging process with only one enabled C-States ###########
 
 
-import subprocess
 import time
 import os
 from pathlib import Path
+from cstate_applier import ConfigApplier
+from rapl_power_monitoring_full import Sampler
+from sweep_stats import SettleDetector
 
 # Constants and configurations
 C_STATES = ['POLL', 'C1', 'C1E', 'C3', 'C6', 'C7s', 'C8', 'C9', 'C10']  # Adjust POLL included here per your system
@@ -14,60 +16,92 @@ P_STATES_ACTIVE_GOVERNOR_MODES = {
 }
 PASSIVE_GOVERNORS = ['conservative', 'ondemand', 'userspace', 'powersave', 'performance', 'schedutil']
 
+# Root of the sysfs tree to configure; point SYSFS_ROOT at a fake_sysfs.py tree to dry-run a sweep
+SYSFS_ROOT = Path(os.environ.get("SYSFS_ROOT", "/"))
+
+# Early stopping: a run ends once the 95 % confidence interval of mean package power is within
+# CI_TOLERANCE_PCT of the mean, after MIN_DURATION to MAX_DURATION s. Benchmark latency is much
+# noisier (tens of % after 5 s), so it gates only with its own LATENCY_CI_TOLERANCE_PCT; with None
+# its interval is just reported
+MIN_DURATION = 5
+MAX_DURATION = 30
+CI_TOLERANCE_PCT = 2.0
+LATENCY_CI_TOLERANCE_PCT = None
+
+# Settling: after a configuration change, recording starts once package power drifts by less than
+# SETTLE_POWER_DRIFT (of its mean) and temperature by less than SETTLE_TEMP_RATE C/s over
+# SETTLE_WINDOW s, or after MAX_SETTLE s. Settle times go to settle_log.csv.
+SETTLE_WINDOW = 3.0
+SETTLE_POWER_DRIFT = 0.03
+SETTLE_TEMP_RATE = 0.1
+MAX_SETTLE = 30
+
 OUTPUT_DIR = Path("benchmark_results")
 OUTPUT_DIR.mkdir(exist_ok=True)
+SETTLE_LOG = OUTPUT_DIR / "settle_log.csv"
+
+applier = None
+sampler = None
+
+def get_applier():
+    # Path maps are built once; every change below writes only the sysfs files whose value differs
+    global applier
+    if applier is None:
+        applier = ConfigApplier(str(SYSFS_ROOT))
+    return applier
 
-def run_cmd(cmd, check=True):
-    print(f"Running command: {cmd}")
-    subprocess.run(cmd, shell=True, check=check)
+def apply_config(**settings):
+    start = time.perf_counter()
+    written = get_applier().apply(**settings)
+    print(f"Applied {settings}: {written} files written in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return written
 
 def set_governor(governor):
     # Set governor for all CPUs
-    cmd = f"echo {governor} | sudo tee /sys/devices/system/cpu/cpu*/cpufreq/scaling_governor"
-    run_cmd(cmd)
+    apply_config(governor=governor)
 
 def set_pstate_preference(pref):
-    cmd = f"echo {pref} | sudo tee /sys/devices/system/cpu/cpu*/cpufreq/energy_performance_preference"
-    run_cmd(cmd)
+    apply_config(epp=pref)
 
 def set_pstate_status(status):
     # status: 'active' or 'passive'
-    cmd = f"echo {status} | sudo tee /sys/devices/system/cpu/intel_pstate/status"
-    run_cmd(cmd)
+    apply_config(status=status)
 
 def disable_all_cstates():
-    for disable_path in Path("/sys/devices/system/cpu").glob("cpu*/cpuidle/state*/disable"):
-        try:
-            with open(disable_path, 'w') as f:
-                f.write('1')
-        except PermissionError:
-            print(f"Permission denied writing to {disable_path}")
+    apply_config(cstates=[])
 
 def enable_cstate_only(target_cstate):
     """
     Enable only the specified C-state (or POLL).
     Disable all others.
     """
-    disable_all_cstates()
-    # Enable only the target
-    for cpuidle_dir in Path("/sys/devices/system/cpu").glob("cpu*/cpuidle"):
-        for state_dir in cpuidle_dir.iterdir():
-            name_file = state_dir / "name"
-            disable_file = state_dir / "disable"
-            if name_file.is_file() and disable_file.is_file():
-                try:
-                    with open(name_file) as f:
-                        name = f.read().strip()
-                    if name == target_cstate:
-                        with open(disable_file, 'w') as f:
-                            f.write('0')  # enable
-                except PermissionError:
-                    print(f"Permission denied accessing {disable_file} or {name_file}")
-
-def run_benchmark_and_logger(filename, duration=30):
-    # Replace the command below with your actual benchmark/logger invocation
-    cmd = f"python3 rapl_logger2.py {duration} -o {filename} --benchmark"
-    run_cmd(cmd)
+    apply_config(cstates=[target_cstate])
+
+def get_sampler():
+    # One warm in-process sampler for the whole sweep: no interpreter start or host discovery per run
+    global sampler
+    if sampler is None:
+        sampler = Sampler(root=str(SYSFS_ROOT), ci_tolerance=CI_TOLERANCE_PCT, min_duration=MIN_DURATION,
+                          ci_latency_tolerance=LATENCY_CI_TOLERANCE_PCT, temperature=True)
+    return sampler
+
+def settle(filename):
+    """Sample without recording until power and temperature are steady; log how long it took."""
+    detector = SettleDetector(SETTLE_WINDOW, SETTLE_POWER_DRIFT, SETTLE_TEMP_RATE)
+    get_sampler().run(MAX_SETTLE, monitor=detector)
+    print(detector.summary())
+    new_log = not SETTLE_LOG.exists()
+    with open(SETTLE_LOG, "a") as f:
+        if new_log:
+            f.write("config,settle_s,settled,power_drift_pct,temp_slope_c_per_s\n")
+        f.write(f"{Path(filename).stem},{detector.elapsed:.2f},{int(detector.settled)},"
+                f"{100 * detector.drift:.2f},{detector.slope:.4f}\n")
+
+def run_benchmark_and_logger(filename, duration=MAX_DURATION):
+    settle(filename)
+    print(f"Logging {duration} s to {filename}")
+    run = get_sampler().run(duration, str(filename))
+    get_sampler().print_benchmark(run)
 
 def main():
     # ACTIVE P-STATES
@@ -83,7 +117,6 @@ def main():
                 enable_cstate_only(cstate)
                 fname = OUTPUT_DIR / f"ACTIVE_{governor}_{pstate_pref}_{cstate}.csv"
                 run_benchmark_and_logger(fname)
-                time.sleep(2)
 
     # PASSIVE P-STATES
     print("Setting P-states to PASSIVE mode")
@@ -97,7 +130,6 @@ def main():
             enable_cstate_only(cstate)
             fname = OUTPUT_DIR / f"PASSIVE_{governor}_{cstate}.csv"
             run_benchmark_and_logger(fname)
-            time.sleep(2)
 
 if __name__ == "__main__":
     main()
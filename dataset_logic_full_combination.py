@@ -1,10 +1,12 @@
 ########### This code automates the logging process with the full combination of C-States ###########
 
-import subprocess
 import time
 import os
 from pathlib import Path
-from itertools import combinations
+from cstate_applier import ConfigApplier
+from rapl_power_monitoring_full import Sampler
+from sweep_stats import SettleDetector
+from sweep_plan import plan_sweep
 
 # Constants and configurations
 C_STATES = ['POLL', 'C1', 'C1E', 'C3', 'C6', 'C7s', 'C8', 'C9', 'C10']  # Adjust POLL included here per your system
@@ -14,113 +16,126 @@ P_STATES_ACTIVE_GOVERNOR_MODES = {
 }
 PASSIVE_GOVERNORS = ['conservative', 'ondemand', 'userspace', 'powersave', 'performance', 'schedutil']
 
-OUTPUT_DIR = Path("benchmark_results")
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-def run_cmd(cmd, check=True):
-    print(f"Running command: {cmd}")
-    subprocess.run(cmd, shell=True, check=check)
+# Root of the sysfs tree to configure; point SYSFS_ROOT at a fake_sysfs.py tree to dry-run a sweep
+SYSFS_ROOT = Path(os.environ.get("SYSFS_ROOT", "/"))
+
+# Early stopping: a run ends once the 95 % confidence interval of mean package power is within
+# CI_TOLERANCE_PCT of the mean, after MIN_DURATION to MAX_DURATION s. Benchmark latency is much
+# noisier (tens of % after 5 s), so it gates only with its own LATENCY_CI_TOLERANCE_PCT; with None
+# its interval is just reported
+MIN_DURATION = 5
+MAX_DURATION = 30
+CI_TOLERANCE_PCT = 2.0
+LATENCY_CI_TOLERANCE_PCT = None
+
+# Settling: after a configuration change, recording starts once package power drifts by less than
+# SETTLE_POWER_DRIFT (of its mean) and temperature by less than SETTLE_TEMP_RATE C/s over
+# SETTLE_WINDOW s, or after MAX_SETTLE s. Settle times go to settle_log.csv.
+SETTLE_WINDOW = 3.0
+SETTLE_POWER_DRIFT = 0.03
+SETTLE_TEMP_RATE = 0.1
+MAX_SETTLE = 30
+
+OUTPUT_DIR = Path("benchmark_results")  # Created by main(), so importing the constants has no side effects
+SETTLE_LOG = OUTPUT_DIR / "settle_log.csv"
+
+applier = None
+sampler = None
+
+def get_applier():
+    # Path maps are built once; every change below writes only the sysfs files whose value differs
+    global applier
+    if applier is None:
+        applier = ConfigApplier(str(SYSFS_ROOT))
+    return applier
+
+def apply_config(**settings):
+    start = time.perf_counter()
+    written = get_applier().apply(**settings)
+    print(f"Applied {settings}: {written} files written in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return written
 
 def set_governor(governor):
     # Set governor for all CPUs
-    cmd = f"echo {governor} | sudo tee /sys/devices/system/cpu/cpu*/cpufreq/scaling_governor"
-    run_cmd(cmd)
+    apply_config(governor=governor)
 
 def set_pstate_preference(pref):
-    cmd = f"echo {pref} | sudo tee /sys/devices/system/cpu/cpu*/cpufreq/energy_performance_preference"
-    run_cmd(cmd)
+    apply_config(epp=pref)
 
 def set_pstate_status(status):
     # status: 'active' or 'passive'
-    cmd = f"echo {status} | sudo tee /sys/devices/system/cpu/intel_pstate/status"
-    run_cmd(cmd)
+    apply_config(status=status)
 
 def disable_all_cstates():
-    for disable_path in Path("/sys/devices/system/cpu").glob("cpu*/cpuidle/state*/disable"):
-        try:
-            with open(disable_path, 'w') as f:
-                f.write('1')
-        except PermissionError:
-            print(f"Permission denied writing to {disable_path}")
+    apply_config(cstates=[])
 
 def enable_cstate_only(target_cstate):
-    disable_all_cstates()
-    for cpuidle_dir in Path("/sys/devices/system/cpu").glob("cpu*/cpuidle"):
-        for state_dir in cpuidle_dir.iterdir():
-            name_file = state_dir / "name"
-            disable_file = state_dir / "disable"
-            if name_file.is_file() and disable_file.is_file():
-                try:
-                    with open(name_file) as f:
-                        name = f.read().strip()
-                    if name == target_cstate:
-                        with open(disable_file, 'w') as f:
-                            f.write('0')
-                except PermissionError:
-                    print(f"Permission denied accessing {disable_file} or {name_file}")
+    """
+    Enable only the specified C-state (or POLL).
+    Disable all others.
+    """
+    apply_config(cstates=[target_cstate])
 
 def enable_cstates_combo(cstate_combo):
-    for cpuidle_dir in Path("/sys/devices/system/cpu").glob("cpu*/cpuidle"):
-        for state_dir in cpuidle_dir.iterdir():
-            name_file = state_dir / "name"
-            disable_file = state_dir / "disable"
-            if name_file.is_file() and disable_file.is_file():
-                try:
-                    with open(name_file) as f:
-                        name = f.read().strip()
-                    with open(disable_file, 'w') as f:
-                        f.write('0' if name in cstate_combo else '1')
-                except PermissionError:
-                    print(f"Permission denied accessing {disable_file} or {name_file}")
-
-def run_benchmark_and_logger(filename, duration=30):
-    cmd = f"python3 rapl_logger2.py {duration} -o {filename} --benchmark"
-    run_cmd(cmd)
-
-def run_cstate_combinations(mode, governor, pstate_pref=None):
-    for r in range(2, len(C_STATES) + 1):
-        for combo in combinations(C_STATES, r):
-            combo_str = "+".join(combo)
-            print(f"Running {mode}: Governor={governor}, P-state={pstate_pref}, C-states={combo_str}")
-            enable_cstates_combo(combo)
-            fname_parts = [mode, governor]
-            if pstate_pref:
-                fname_parts.append(pstate_pref)
-            fname_parts.append(f"COMBO_{combo_str}")
-            fname = OUTPUT_DIR / ("_".join(fname_parts) + ".csv")
-            run_benchmark_and_logger(fname)
-            time.sleep(2)
+    """Enable exactly the states in cstate_combo; return the number of disable files written."""
+    return apply_config(cstates=cstate_combo)
+
+def get_sampler():
+    # One warm in-process sampler for the whole sweep: no interpreter start or host discovery per run
+    global sampler
+    if sampler is None:
+        sampler = Sampler(root=str(SYSFS_ROOT), ci_tolerance=CI_TOLERANCE_PCT, min_duration=MIN_DURATION,
+                          ci_latency_tolerance=LATENCY_CI_TOLERANCE_PCT, temperature=True)
+    return sampler
+
+def settle(filename):
+    """Sample without recording until power and temperature are steady; log how long it took."""
+    detector = SettleDetector(SETTLE_WINDOW, SETTLE_POWER_DRIFT, SETTLE_TEMP_RATE)
+    get_sampler().run(MAX_SETTLE, monitor=detector)
+    print(detector.summary())
+    new_log = not SETTLE_LOG.exists()
+    with open(SETTLE_LOG, "a") as f:
+        if new_log:
+            f.write("config,settle_s,settled,power_drift_pct,temp_slope_c_per_s\n")
+        f.write(f"{Path(filename).stem},{detector.elapsed:.2f},{int(detector.settled)},"
+                f"{100 * detector.drift:.2f},{detector.slope:.4f}\n")
+
+def run_benchmark_and_logger(filename, duration=MAX_DURATION):
+    settle(filename)
+    print(f"Logging {duration} s to {filename}")
+    run = get_sampler().run(duration, str(filename))
+    get_sampler().print_benchmark(run)
+
+def config_filename(mode, governor, pstate_pref, cstate_combo):
+    fname_parts = [mode, governor]
+    if pstate_pref:
+        fname_parts.append(pstate_pref)
+    # Single states keep their plain name, larger subsets are COMBO_ runs
+    fname_parts.append(cstate_combo[0] if len(cstate_combo) == 1 else f"COMBO_{'+'.join(cstate_combo)}")
+    return OUTPUT_DIR / ("_".join(fname_parts) + ".csv")
 
 def main():
-    # ACTIVE P-STATES
-    print("Setting P-states to ACTIVE mode")
-    set_pstate_status('active')
-
-    for governor, p_prefs in P_STATES_ACTIVE_GOVERNOR_MODES.items():
-        set_governor(governor)
-        for pstate_pref in p_prefs:
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    # Serpentine Gray code order: consecutive runs differ by one C-state, or only by governor/EPP
+    plan = plan_sweep(C_STATES, P_STATES_ACTIVE_GOVERNOR_MODES, PASSIVE_GOVERNORS)
+    current_mode = current_governor = current_pref = None
+    for mode, governor, pstate_pref, cstate_combo in plan:
+        if mode != current_mode:
+            print(f"Setting P-states to {mode} mode")
+            set_pstate_status(mode.lower())
+            current_mode = mode
+            current_governor = current_pref = None  # A mode switch resets the governor and EPP
+        if governor != current_governor:
+            set_governor(governor)
+            current_governor = governor
+            current_pref = None
+        if pstate_pref and pstate_pref != current_pref:
             set_pstate_preference(pstate_pref)
-            for cstate in C_STATES:
-                print(f"Running ACTIVE: Governor={governor}, P-state={pstate_pref}, C-state={cstate}")
-                enable_cstate_only(cstate)
-                fname = OUTPUT_DIR / f"ACTIVE_{governor}_{pstate_pref}_{cstate}.csv"
-                run_benchmark_and_logger(fname)
-                time.sleep(2)
-            run_cstate_combinations("ACTIVE", governor, pstate_pref)
-
-    # PASSIVE P-STATES
-    print("Setting P-states to PASSIVE mode")
-    set_pstate_status('passive')
-
-    for governor in PASSIVE_GOVERNORS:
-        set_governor(governor)
-        for cstate in C_STATES:
-            print(f"Running PASSIVE: Governor={governor}, C-state={cstate}")
-            enable_cstate_only(cstate)
-            fname = OUTPUT_DIR / f"PASSIVE_{governor}_{cstate}.csv"
-            run_benchmark_and_logger(fname)
-            time.sleep(2)
-        run_cstate_combinations("PASSIVE", governor)
+            current_pref = pstate_pref
+        combo_str = "+".join(cstate_combo)
+        print(f"Running {mode}: Governor={governor}, P-state={pstate_pref}, C-states={combo_str}")
+        enable_cstates_combo(cstate_combo)
+        run_benchmark_and_logger(config_filename(mode, governor, pstate_pref, cstate_combo))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,201 @@
+### Synthesizes a sysfs/procfs tree (CPUs, cpuidle, RAPL, intel_pstate, package thermal zone) for testing and benchmarking off real hardware ###
+#
+#   python3 fake_sysfs.py /tmp/fakehost --cpus 64
+#   python3 rapl_power_monitoring_full.py 10 --root /tmp/fakehost
+#
+# FakeHost.advance() moves every counter forward as if time had passed, so a
+# sampler pointed at the tree sees changing, wrapping values.
+import argparse
+import os
+import shutil
+
+import numpy as np
+
+CSTATES = ["POLL", "C1", "C1E", "C3", "C6", "C7s", "C8", "C9", "C10"]
+GOVERNORS = "performance powersave"
+EPP_VALUES = "default performance balance_performance balance_power power"
+TSC_HZ = 2_400_000_000
+THERMAL_TAU_S = 4.0
+MSR_REGISTERS = {"tsc": 0x10, "mperf": 0xE7, "aperf": 0xE8}
+MARKER = ".fake_sysfs"  # Written by build(); only a directory carrying it is ever deleted
+FREQ_TABLE_KHZ = list(range(4_200_000, 799_999, -200_000))  # time_in_state lists the highest first
+
+
+class FakeHost:
+    """A synthetic host under root: CPUs with cpufreq and cpuidle, RAPL domains, intel_pstate and
+    an x86_pkg_temp thermal zone whose temperature follows the load with a lag.
+
+    With cpufreq_stats=True every CPU also gets cpufreq/stats/time_in_state and
+    total_trans, as with acpi-cpufreq or intel_pstate in passive mode. With
+    msr=True, dev/cpu/N/msr files hold APERF, MPERF and TSC, register r at byte
+    offset 8 * r (see msr_reader.py).
+    """
+
+    def __init__(self, root, cpus=8, cstates=CSTATES, packages=1, pstate_status="active",
+                 governor="powersave", epp="balance_performance", energy_range_uj=1 << 32, seed=0,
+                 cpufreq_stats=False, msr=False):
+        self.root = root
+        self.cpus = cpus
+        self.cstates = list(cstates)
+        self.packages = packages
+        self.pstate_status = pstate_status
+        self.governor = governor
+        self.epp = epp
+        self.energy_range_uj = energy_range_uj
+        self.rng = np.random.default_rng(seed)
+        # package, core, uncore per package
+        self.rapl_dirs = []
+        self.energy_uj = []
+        self.power_w = []
+        self.cstate_time_us = np.zeros((cpus, len(self.cstates)), dtype=np.int64)
+        self.cstate_usage = np.zeros((cpus, len(self.cstates)), dtype=np.int64)
+        self.jiffies = np.zeros((cpus, 10), dtype=np.int64)
+        self.freq_khz = np.full(cpus, 2_400_000, dtype=np.int64)
+        self.cpufreq_stats = cpufreq_stats
+        self.time_in_state = np.zeros((cpus, len(FREQ_TABLE_KHZ)), dtype=np.int64)  # 10 ms units
+        self.total_trans = np.zeros(cpus, dtype=np.int64)
+        self.msr = msr
+        self.msr_counters = {name: np.zeros(cpus, dtype=np.uint64) for name in MSR_REGISTERS}
+        self.temp_c = 40.0  # Package temperature, lagging the load with a THERMAL_TAU_S time constant
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def cpu_path(self, cpu, *parts):
+        return self.path("sys", "devices", "system", "cpu", f"cpu{cpu}", *parts)
+
+    @staticmethod
+    def _write(path, value):
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
+
+    def build(self):
+        """Create the tree. An earlier fake tree at root is replaced; any other non-empty path is refused."""
+        if os.path.isfile(os.path.join(self.root, MARKER)):
+            shutil.rmtree(self.root)
+        elif os.path.exists(self.root) and (not os.path.isdir(self.root) or os.listdir(self.root)):
+            raise FileExistsError(f"{self.root} exists and is not a fake host tree; refusing to replace it")
+        os.makedirs(self.root, exist_ok=True)
+        self._write(os.path.join(self.root, MARKER), "fake_sysfs.FakeHost")
+        powercap = self.path("sys", "class", "powercap")
+        for package in range(self.packages):
+            package_dir = os.path.join(powercap, f"intel-rapl:{package}")
+            domains = [(package_dir, f"package-{package}", 15.0)]
+            for sub, (name, watts) in enumerate([("core", 8.0), ("uncore", 2.0)]):
+                domains.append((os.path.join(package_dir, f"intel-rapl:{package}:{sub}"), name, watts))
+            for domain_dir, name, watts in domains:
+                os.makedirs(domain_dir)
+                self._write(os.path.join(domain_dir, "name"), name)
+                self._write(os.path.join(domain_dir, "max_energy_range_uj"), self.energy_range_uj - 1)
+                self.rapl_dirs.append(domain_dir)
+                self.energy_uj.append(int(self.rng.integers(0, self.energy_range_uj)))
+                self.power_w.append(watts)
+
+        pstate_dir = self.path("sys", "devices", "system", "cpu", "intel_pstate")
+        os.makedirs(pstate_dir)
+        self._write(os.path.join(pstate_dir, "status"), self.pstate_status)
+
+        for cpu in range(self.cpus):
+            cpufreq = self.cpu_path(cpu, "cpufreq")
+            os.makedirs(cpufreq)
+            if self.cpufreq_stats:
+                os.makedirs(os.path.join(cpufreq, "stats"))
+            self._write(os.path.join(cpufreq, "scaling_governor"), self.governor)
+            self._write(os.path.join(cpufreq, "scaling_available_governors"), GOVERNORS)
+            if self.pstate_status == "active":
+                self._write(os.path.join(cpufreq, "energy_performance_preference"), self.epp)
+                self._write(os.path.join(cpufreq, "energy_performance_available_preferences"), EPP_VALUES)
+            for state, name in enumerate(self.cstates):
+                state_dir = self.cpu_path(cpu, "cpuidle", f"state{state}")
+                os.makedirs(state_dir)
+                self._write(os.path.join(state_dir, "name"), name)
+                self._write(os.path.join(state_dir, "disable"), 0)
+        zone = self.path("sys", "class", "thermal", "thermal_zone0")
+        os.makedirs(zone)
+        self._write(os.path.join(zone, "type"), "x86_pkg_temp")
+        os.makedirs(self.path("proc"))
+        if self.msr:
+            for cpu in range(self.cpus):
+                os.makedirs(self.path("dev", "cpu", str(cpu)))
+        self.write_counters()
+        return self
+
+    def write_counters(self):
+        for domain_dir, energy in zip(self.rapl_dirs, self.energy_uj):
+            self._write(os.path.join(domain_dir, "energy_uj"), energy)
+        for cpu in range(self.cpus):
+            self._write(self.cpu_path(cpu, "cpufreq", "scaling_cur_freq"), self.freq_khz[cpu])
+            if self.cpufreq_stats:
+                stats = self.cpu_path(cpu, "cpufreq", "stats")
+                with open(os.path.join(stats, "time_in_state"), "w") as f:
+                    f.writelines(f"{khz} {t}\n" for khz, t in zip(FREQ_TABLE_KHZ, self.time_in_state[cpu].tolist()))
+                self._write(os.path.join(stats, "total_trans"), self.total_trans[cpu])
+            for state in range(len(self.cstates)):
+                state_dir = self.cpu_path(cpu, "cpuidle", f"state{state}")
+                self._write(os.path.join(state_dir, "time"), self.cstate_time_us[cpu, state])
+                self._write(os.path.join(state_dir, "usage"), self.cstate_usage[cpu, state])
+        self._write(self.path("sys", "class", "thermal", "thermal_zone0", "temp"), int(self.temp_c * 1000))
+        if self.msr:
+            for cpu in range(self.cpus):
+                with open(self.path("dev", "cpu", str(cpu), "msr"), "wb") as f:
+                    for name, register in MSR_REGISTERS.items():
+                        f.seek(8 * register)
+                        f.write(int(self.msr_counters[name][cpu]).to_bytes(8, "little"))
+        lines = [f"cpu  {' '.join(map(str, self.jiffies.sum(axis=0)))}"]
+        lines += [f"cpu{cpu} {' '.join(map(str, row))}" for cpu, row in enumerate(self.jiffies.tolist())]
+        lines += ["intr 0", "ctxt 0", "btime 0", "processes 0", "procs_running 1", "procs_blocked 0"]
+        with open(self.path("proc", "stat"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def advance(self, seconds, busy=0.3):
+        """Move every counter forward by `seconds` of activity at roughly `busy` utilization."""
+        for i, watts in enumerate(self.power_w):
+            joules = watts * seconds * (0.5 + busy)
+            self.energy_uj[i] = (self.energy_uj[i] + int(joules * 1_000_000)) % self.energy_range_uj
+        idle_us = int(seconds * 1_000_000 * (1 - busy))
+        shares = self.rng.dirichlet(np.ones(len(self.cstates)), size=self.cpus)
+        self.cstate_time_us += (shares * idle_us).astype(np.int64)
+        self.cstate_usage += self.rng.integers(0, 50, size=self.cstate_usage.shape)
+        ticks = int(seconds * 100)  # USER_HZ
+        busy_ticks = self.rng.binomial(ticks, busy, size=self.cpus)
+        self.jiffies[:, 0] += busy_ticks
+        self.jiffies[:, 3] += ticks - busy_ticks
+        # Busier CPUs spend more of the interval at high frequencies
+        weights = np.linspace(busy, 1 - busy, len(FREQ_TABLE_KHZ)) + 0.05
+        shares = self.rng.multinomial(ticks, weights / weights.sum(), size=self.cpus)
+        self.time_in_state += shares
+        self.total_trans += self.rng.poisson(seconds * 200, size=self.cpus)
+        self.freq_khz = np.array(FREQ_TABLE_KHZ)[shares.argmax(axis=1)]
+        target = 40.0 + 50.0 * busy
+        self.temp_c += (target - self.temp_c) * (1 - np.exp(-seconds / THERMAL_TAU_S))
+        # MPERF counts at the TSC rate while unhalted, APERF at the delivered frequency
+        tsc = np.uint64(int(seconds * TSC_HZ))
+        mperf = (busy_ticks / max(ticks, 1) * int(tsc)).astype(np.uint64)
+        self.msr_counters["tsc"] += tsc
+        self.msr_counters["mperf"] += mperf
+        self.msr_counters["aperf"] += (mperf * (self.freq_khz * 1000 / TSC_HZ)).astype(np.uint64)
+        self.write_counters()
+
+    def set_disabled(self, cpu, state, disabled=True):
+        self._write(self.cpu_path(cpu, "cpuidle", f"state{state}", "disable"), int(disabled))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a fake sysfs/procfs tree")
+    parser.add_argument("root", help="Directory to create (an earlier fake host tree there is replaced)")
+    parser.add_argument("--cpus", type=int, default=8)
+    parser.add_argument("--packages", type=int, default=1)
+    parser.add_argument("--pstate-status", choices=["active", "passive"], default="active")
+    parser.add_argument("--cpufreq-stats", action="store_true", help="Add cpufreq/stats counters")
+    parser.add_argument("--msr", action="store_true", help="Add dev/cpu/N/msr files with APERF/MPERF/TSC")
+    args = parser.parse_args()
+    try:
+        FakeHost(args.root, args.cpus, packages=args.packages, pstate_status=args.pstate_status,
+                 cpufreq_stats=args.cpufreq_stats, msr=args.msr).build()
+    except FileExistsError as e:
+        parser.error(str(e))
+    print(f"Fake host with {args.cpus} CPUs created under {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+### Fixed-memory, log-bucketed (HDR-style) latency histograms with periodic JSON-lines dumps ###
+#
+# Values are integer microseconds. Values below 2 * SUB_BUCKETS get one bucket
+# each; above that every power-of-two range is split into SUB_BUCKETS equal
+# buckets, so a reported percentile is within 1 / SUB_BUCKETS (about 3 %) of
+# the true value, whatever the magnitude. Memory is fixed at MAX_BUCKETS counts.
+import json
+import time
+
+import numpy as np
+
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_VALUE_US = (1 << 36) - 1  # About 19 hours; larger values are clamped
+MAX_BUCKETS = (MAX_VALUE_US.bit_length() - SUB_BITS + 1) * SUB_BUCKETS
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - 1 - SUB_BITS
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_bounds(index):
+    """(lowest, highest) value that falls in bucket index."""
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    low = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """Counts of microsecond values in log buckets, plus exact count, sum, min and max."""
+
+    def __init__(self):
+        self.counts = np.zeros(MAX_BUCKETS, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.counts.fill(0)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """Record a duration in seconds (negative values count as 0)."""
+        value = min(max(int(seconds * 1_000_000), 0), MAX_VALUE_US)
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add(self, other):
+        if other.count == 0:
+            return
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, q):
+        """Value in microseconds at percentile q (0-100), or None when empty."""
+        if self.count == 0:
+            return None
+        rank = max(int(np.ceil(q / 100 * self.count)), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        low, high = bucket_bounds(index)
+        # Never report past the exact extremes
+        return min(max((low + high) / 2, self.min), self.max)
+
+    def summary(self):
+        """Count, mean, min, max and PERCENTILES in microseconds, as a dict."""
+        result = {"count": self.count}
+        if self.count:
+            result.update(mean=self.total / self.count, min=self.min, max=self.max)
+            for q in PERCENTILES:
+                result[f"p{q:g}"] = self.percentile(q)
+        return result
+
+    def format(self, unit_us=1000, unit="ms"):
+        if self.count == 0:
+            return "no samples"
+        summary = self.summary()
+        parts = [f"{key} {summary[key] / unit_us:.3f}"
+                 for key in ["mean"] + [f"p{q:g}" for q in PERCENTILES] + ["max"]]
+        return f"{', '.join(parts)} {unit} (n={self.count})"
+
+
+class HistogramLog:
+    """Appends interval histograms as JSON lines every `interval` seconds and keeps run totals.
+
+    Each line holds the summary of every named histogram since the previous
+    dump; the interval histograms are then folded into `totals` and reset.
+    """
+
+    def __init__(self, names, path=None, interval=60.0):
+        self.current = {name: LatencyHistogram() for name in names}
+        self.totals = {name: LatencyHistogram() for name in names}
+        self.path = path
+        self.interval = interval
+        self.f = open(path, "a") if path else None
+        self.last_dump = time.monotonic()
+
+    def record(self, name, seconds):
+        self.current[name].record(seconds)
+
+    def maybe_dump(self, now):
+        if now - self.last_dump >= self.interval:
+            self.dump(now)
+
+    def dump(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.f is not None and any(h.count for h in self.current.values()):
+            line = {"time": time.time(), "interval_s": now - self.last_dump, "unit": "us"}
+            line.update({name: h.summary() for name, h in self.current.items()})
+            self.f.write(json.dumps(line) + "\n")
+            self.f.flush()
+        for name, histogram in self.current.items():
+            self.totals[name].add(histogram)
+            histogram.reset()
+        self.last_dump = now
+
+    def close(self):
+        self.dump()
+        if self.f is not None:
+            self.f.close()
@@ -0,0 +1,69 @@
+### Matrix multiplication latency probe running beside the sampler on its own schedule ###
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatencyProbe:
+    """Times np.dot on preallocated matrices from a worker thread.
+
+    Each result is stamped with time.monotonic() at completion and queued; the
+    sampler drains the results that completed before a tick and merges them
+    into that row, so its cadence never depends on BLAS runtime. np.dot
+    releases the GIL, so the worker does not stall the sampling thread.
+    """
+
+    def __init__(self, interval=0.5, size=300, max_pending=4096):
+        self.interval = interval
+        rng = np.random.default_rng()
+        self.a = rng.random((size, size))
+        self.b = rng.random((size, size))
+        self.out = np.empty((size, size))
+        self.results = deque(maxlen=max_pending)  # (completed_at, latency_ms)
+        self.runs = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        start = time.monotonic()
+        np.dot(self.a, self.b, out=self.out)
+        end = time.monotonic()
+        self.results.append((end, (end - start) * 1000))  # in milliseconds
+        self.runs += 1
+
+    def _loop(self):
+        start_time = time.monotonic()
+        iteration = 0
+        while not self._stop.is_set():
+            self.run_once()
+            iteration += 1
+            next_run = start_time + iteration * self.interval
+            delay = next_run - time.monotonic()
+            if delay < 0:
+                # Skip the runs we missed rather than bursting to catch up
+                iteration += int(-delay // self.interval) + 1
+                delay = start_time + iteration * self.interval - time.monotonic()
+            self._stop.wait(max(delay, 0))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="latency-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def drain(self, until):
+        """Mean latency of the results completed up to monotonic time until, or None."""
+        total = 0.0
+        count = 0
+        results = self.results
+        while results and results[0][0] <= until:
+            total += results.popleft()[1]
+            count += 1
+        return total / count if count else None
@@ -0,0 +1,192 @@
+### Embedded OpenMetrics exporter: serves the sampler's latest values over HTTP (TCP or UNIX socket) ###
+#
+# Exposed families, with labels taken from the logger's column headers:
+#   rapl_energy_joules_total{domain}                  counter, cumulative energy since the logger started
+#   rapl_power_watts{domain}                          gauge
+#   cpu_frequency_hertz{cpu}                          gauge
+#   cpu_utilization_ratio{cpu}                        gauge
+#   cpu_idle_residency_seconds_total{cpu,state}       counter, accumulated from the residency deltas
+#   rapl_logger_samples_total                         counter
+#
+#   curl -s http://127.0.0.1:9464/metrics
+#   curl -s --unix-socket /run/rapl-logger.sock http://localhost/metrics
+import os
+import re
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+CSTATE_HEADER = re.compile(r"CPU(\d+)_(.+) \(ms\)$")
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsExporter:
+    """Keeps the latest value of every exposed series in flat arrays and renders them on demand.
+
+    publish(row) runs on the sampling thread and only copies values and adds
+    deltas into preallocated arrays. render() runs on the server thread; the
+    text is built from precomputed "name{labels} " prefixes at most once per
+    published row, so repeated scrapes return cached bytes.
+    """
+
+    def __init__(self, schema):
+        self.families = []  # (name, type, help, prefixes, positions in values, fmt)
+        self.sources = []   # (field, indices, scale, accumulate)
+        columns = {}
+        for header, field, index, _, _ in schema.columns:
+            columns.setdefault(field, []).append((header, index))
+        fields = {name for name, _, _ in schema.fields}
+
+        # The high-rate (--rapl-hz) schema names the same per-domain fields power_w and energy_j
+        power_field = next((field for field in ("rapl_w", "power_w") if field in columns), None)
+        energy_field = next((field for field in ("rapl_energy_j", "energy_j") if field in fields), None)
+        if power_field:
+            domains = [header[:-len(" (W)")] for header, _ in columns[power_field]]
+            indices = [index for _, index in columns[power_field]]
+            if energy_field:
+                self._family("rapl_energy_joules", "counter", "Energy consumed per RAPL domain",
+                             [f'rapl_energy_joules_total{{domain="{_label(d)}"}} ' for d in domains],
+                             energy_field, indices, 1.0, False, "%.6f")
+            self._family("rapl_power_watts", "gauge", "Average power per RAPL domain over the last interval",
+                         [f'rapl_power_watts{{domain="{_label(d)}"}} ' for d in domains],
+                         power_field, indices, 1.0, False, "%.3f")
+        if "freq_mhz" in columns:
+            indices = [index for _, index in columns["freq_mhz"]]
+            self._family("cpu_frequency_hertz", "gauge",
+                         "CPU frequency (interval mean from cpufreq stats, else scaling_cur_freq)",
+                         [f'cpu_frequency_hertz{{cpu="{cpu}"}} ' for cpu in indices],
+                         "freq_mhz", indices, 1e6, False, "%.0f")
+        if "util" in columns:
+            indices = [index for _, index in columns["util"]]
+            self._family("cpu_utilization_ratio", "gauge", "CPU busy fraction over the last interval",
+                         [f'cpu_utilization_ratio{{cpu="{cpu}"}} ' for cpu in indices],
+                         "util", indices, 0.01, False, "%.4f")
+        if "cstate_ms" in columns:
+            prefixes, indices = [], []
+            for header, index in columns["cstate_ms"]:
+                match = CSTATE_HEADER.match(header)
+                if match:
+                    prefixes.append(f'cpu_idle_residency_seconds_total{{cpu="{match.group(1)}",'
+                                    f'state="{_label(match.group(2))}"}} ')
+                    indices.append(index)
+            self._family("cpu_idle_residency_seconds", "counter", "Time spent in each enabled idle state",
+                         prefixes, "cstate_ms", indices, 0.001, True, "%.6f")
+
+        self.values = np.zeros(sum(len(source[1]) for source in self.sources))
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._rendered_generation = -1
+        self._rendered = b""
+        self.scrapes = 0
+
+    def _family(self, name, kind, help_text, prefixes, field, indices, scale, accumulate, fmt):
+        start = sum(len(source[1]) for source in self.sources)
+        self.sources.append((field, np.array(indices, dtype=np.intp), scale, accumulate))
+        self.families.append((name, kind, help_text, prefixes, slice(start, start + len(indices)), fmt))
+
+    def publish(self, row):
+        """Fold one sample row in (sampling thread)."""
+        with self._lock:
+            offset = 0
+            for field, indices, scale, accumulate in self.sources:
+                values = row[field][indices] * scale
+                target = self.values[offset:offset + len(indices)]
+                if accumulate:
+                    # Deltas are NaN on ticks where the collector did not run
+                    target += np.nan_to_num(values)
+                else:
+                    target[:] = values
+                offset += len(indices)
+            self.samples += 1
+            self._generation += 1
+
+    def render(self):
+        """OpenMetrics text of the latest values; cached until the next publish."""
+        with self._lock:
+            if self._rendered_generation == self._generation:
+                return self._rendered
+            values = self.values.copy()
+            samples = self.samples
+            generation = self._generation
+        lines = []
+        for name, kind, help_text, prefixes, positions, fmt in self.families:
+            lines.append(f"# TYPE {name} {kind}\n# HELP {name} {help_text}\n")
+            text = np.char.mod(fmt, values[positions]).astype(object)
+            text[np.isnan(values[positions])] = "NaN"
+            lines.extend(prefix + value + "\n" for prefix, value in zip(prefixes, text.tolist()))
+        lines.append("# TYPE rapl_logger_samples counter\n# HELP rapl_logger_samples Rows sampled by the logger\n"
+                     f"rapl_logger_samples_total {samples}\n# EOF\n")
+        rendered = "".join(lines).encode()
+        with self._lock:
+            if generation >= self._rendered_generation:
+                self._rendered, self._rendered_generation = rendered, generation
+        return rendered
+
+
+class _Handler(BaseHTTPRequestHandler):
+    exporter = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.exporter.render()
+        self.exporter.scrapes += 1
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # No per-scrape logging on the logger's stdout
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)  # BaseHTTPRequestHandler expects a (host, port) address
+
+
+class MetricsServer:
+    """Serves an exporter on address: "host:port" (TCP) or a filesystem path (UNIX socket)."""
+
+    def __init__(self, exporter, address):
+        self.exporter = exporter
+        handler = type("Handler", (_Handler,), {"exporter": exporter})
+        if address.startswith("/") or address.startswith("./"):
+            if os.path.exists(address):
+                os.remove(address)
+            self.server = _UnixHTTPServer(address, handler)
+            self.address = address
+        else:
+            host, _, port = address.rpartition(":")
+            self.server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), handler)
+            self.server.daemon_threads = True
+            self.address = "%s:%d" % self.server.server_address[:2]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+
+    def publish(self, row):
+        self.exporter.publish(row)
+
+    def stats(self):
+        return f"Metrics: {self.exporter.scrapes} scrapes served on {self.address}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.server, _UnixHTTPServer):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
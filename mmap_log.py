@@ -0,0 +1,291 @@
+### Memory-mapped, crash-safe append log of fixed-size sample records ###
+#
+# A log is a series of pre-sized segment files <prefix>.000000.seg, <prefix>.000001.seg, ...
+# Segment layout (little-endian):
+#   offset  0  8 bytes  magic b"RAPLSEG1"
+#   offset  8  u32      format version (2)
+#   offset 12  u32      header size in bytes (records start here, page aligned)
+#   offset 16  u64      record size in bytes
+#   offset 24  u64      capacity in records
+#   offset 32  u64      committed records, bumped only after a record is fully written
+#   offset 40  u64      segment index
+#   offset 48  u32      flags: bit 0 = sealed, no more rows will be committed to this segment
+#   offset 52  u32      length of the JSON schema that follows
+#   offset 56  ...      JSON {"fields": [[name, dtype, shape]...], "columns": [...]}
+#   header size + i * record size   record i
+#
+# The writer copies each row into the mapping and then bumps the committed
+# counter, so rows land in the page cache without write syscalls and survive
+# SIGKILL of the logger; a reader never looks past the committed counter and
+# therefore never sees a torn record. A segment is sealed after its last row
+# (rollover or close); readers move on to the next segment only then, since
+# daemon rotation rolls segments long before they are full. Version 1
+# segments (no flags field) count as sealed once full. Segment blocks are
+# allocated up front, so a full disk surfaces as an OSError when a segment is
+# created or rolled over.
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from sample_store import Schema
+
+MAGIC = b"RAPLSEG1"
+VERSION = 2
+COMMITTED_OFFSET = 32
+FLAGS_OFFSET = 48
+SCHEMA_OFFSET = 56
+SEALED = 1
+V1_SCHEMA_OFFSET = 52
+
+
+def segment_path(prefix, index):
+    return f"{prefix}.{index:06d}.seg"
+
+
+def schema_json(schema):
+    return json.dumps({
+        "fields": [[name, np.dtype(dtype).str, list(shape)] for name, dtype, shape in schema.fields],
+        "columns": [list(column) for column in schema.columns],
+    }).encode()
+
+
+def schema_from_json(data):
+    meta = json.loads(data)
+    schema = Schema()
+    schema.fields = [(name, dtype, tuple(shape)) for name, dtype, shape in meta["fields"]]
+    schema.columns = [tuple(column) for column in meta["columns"]]
+    return schema
+
+
+class Segment:
+    """One mapped segment file with views of its committed counter, flags and records."""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        flags = os.O_RDWR if writable else os.O_RDONLY
+        fd = os.open(path, flags)
+        try:
+            size = os.fstat(fd).st_size
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self.mm = mmap.mmap(fd, size, access=access)
+        finally:
+            os.close(fd)
+        magic, version, header_size, record_size, capacity = struct.unpack_from("<8sIIQQ", self.mm, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a version 1 or {VERSION} sample segment")
+        if version == 1:
+            (schema_len,) = struct.unpack_from("<I", self.mm, FLAGS_OFFSET)
+            schema_offset = V1_SCHEMA_OFFSET
+            self.flags = None
+        else:
+            (schema_len,) = struct.unpack_from("<I", self.mm, FLAGS_OFFSET + 4)
+            schema_offset = SCHEMA_OFFSET
+            self.flags = np.ndarray((1,), dtype="<u4", buffer=self.mm, offset=FLAGS_OFFSET)
+        self.schema_json = bytes(self.mm[schema_offset:schema_offset + schema_len])
+        self.schema = schema_from_json(self.schema_json)
+        self.index = struct.unpack_from("<Q", self.mm, 40)[0]
+        self.capacity = capacity
+        self.committed = np.ndarray((1,), dtype="<u8", buffer=self.mm, offset=COMMITTED_OFFSET)
+        self.records = np.ndarray((capacity,), dtype=self.schema.dtype, buffer=self.mm, offset=header_size)
+
+    @classmethod
+    def create(cls, path, schema, capacity, index):
+        dtype = schema.dtype
+        meta = schema_json(schema)
+        header_size = -(-(SCHEMA_OFFSET + len(meta)) // mmap.PAGESIZE) * mmap.PAGESIZE
+        header = struct.pack("<8sIIQQQQII", MAGIC, VERSION, header_size, dtype.itemsize,
+                             capacity, 0, index, 0, len(meta)) + meta
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(header)
+                f.flush()
+                # Reserve every block now: a store into a hole on a full disk would SIGBUS the
+                # writer mid-row, whereas this fails with OSError (ENOSPC) before the segment is used
+                os.posix_fallocate(f.fileno(), 0, header_size + capacity * dtype.itemsize)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.replace(tmp_path, path)
+        return cls(path, writable=True)
+
+    @property
+    def sealed(self):
+        if self.flags is None:
+            return int(self.committed[0]) >= self.capacity
+        return bool(self.flags[0] & SEALED)
+
+    def seal(self):
+        """Mark the segment complete; call after its last committed row."""
+        if self.flags is not None:
+            self.flags[0] |= SEALED
+
+    def close(self):
+        # Drop the numpy views before unmapping
+        self.committed = None
+        self.flags = None
+        self.records = None
+        self.mm.close()
+
+
+class MmapSegmentLog:
+    """Appends rows straight into mapped segments, rolling over every segment_rows rows.
+
+    A prefix that already holds segments is continued after its last one,
+    which is sealed first (an earlier run killed mid-segment left it open), so
+    readers go straight on into this run's rows. Continuing a log written with
+    a different schema raises ValueError.
+    """
+
+    def __init__(self, prefix, schema, segment_rows=65536):
+        self.prefix = prefix
+        self.schema = schema
+        self.segment_rows = segment_rows
+        self.rows = 0
+        index = 0
+        existing = self.list_segments()
+        if existing:
+            last = Segment(existing[-1], writable=True)
+            try:
+                if last.schema_json != schema_json(schema):
+                    raise ValueError(f"{prefix} holds a log with a different schema ({existing[-1]}); "
+                                     f"use another output prefix")
+                last.seal()
+                last.mm.flush()
+                index = last.index + 1  # Never overwrite an earlier run's segments
+            finally:
+                last.close()
+        self.segment = Segment.create(segment_path(prefix, index), schema, segment_rows, index)
+
+    def list_segments(self):
+        return sorted(glob.glob(glob.escape(self.prefix) + ".[0-9]*.seg"))
+
+    def _roll(self):
+        index = self.segment.index + 1
+        self.segment.seal()
+        self.segment.mm.flush()
+        self.segment.close()
+        self.segment = Segment.create(segment_path(self.prefix, index), self.schema, self.segment_rows, index)
+
+    def append(self, row):
+        segment = self.segment
+        committed = int(segment.committed[0])
+        if committed >= segment.capacity:
+            self._roll()
+            segment = self.segment
+            committed = 0
+        segment.records[committed] = row
+        segment.committed[0] = committed + 1  # Publish only after the record is complete
+        self.rows += 1
+
+    def sync(self):
+        """msync the current segment so committed rows also survive a kernel crash."""
+        self.segment.mm.flush()
+
+    def close(self):
+        self.segment.seal()
+        self.sync()
+        self.segment.close()
+
+
+class MmapLogReader:
+    """Reads a log's committed rows, following new rows and segments while it is written."""
+
+    def __init__(self, prefix, start_segment=None):
+        self.prefix = prefix
+        self.segment = None
+        if start_segment is None:
+            # Retention may have deleted the first segments of a long-running log
+            indices = [int(path[len(prefix) + 1:-4]) for path in glob.glob(glob.escape(prefix) + ".[0-9]*.seg")]
+            start_segment = min(indices, default=0)
+        self.segment_index = start_segment
+        self.position = 0
+
+    def _open(self):
+        if self.segment is None:
+            path = segment_path(self.prefix, self.segment_index)
+            if not os.path.exists(path):
+                return None
+            self.segment = Segment(path)
+            self.position = 0
+        return self.segment
+
+    @property
+    def schema(self):
+        segment = self._open()
+        return segment.schema if segment is not None else None
+
+    def read_new(self):
+        """Copy of all rows committed since the previous call (possibly empty), or None before the log exists."""
+        chunks = []
+        while True:
+            segment = self._open()
+            if segment is None:
+                break
+            sealed = segment.sealed  # Before the counter: once sealed, the counter is final
+            committed = int(segment.committed[0])
+            if committed > self.position:
+                chunks.append(segment.records[self.position:committed].copy())
+                self.position = committed
+            if not sealed or not os.path.exists(segment_path(self.prefix, self.segment_index + 1)):
+                break
+            segment.close()
+            self.segment = None
+            self.segment_index += 1
+        if not chunks:
+            schema = self.schema
+            return None if schema is None else np.zeros(0, dtype=schema.dtype)
+        return np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+
+def read_log(prefix):
+    """Every committed row of a log as one structured array, plus its schema."""
+    reader = MmapLogReader(prefix)
+    records = reader.read_new()
+    schema = reader.schema
+    reader.close()
+    return records, schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a mmap sample log as CSV, optionally following it")
+    parser.add_argument("prefix", help="Log prefix given to the logger with --format mmap")
+    parser.add_argument("-f", "--follow", action="store_true", help="Keep printing rows as they are committed")
+    parser.add_argument("--poll", type=float, default=0.2, help="Follow poll interval in seconds")
+    args = parser.parse_args()
+
+    reader = MmapLogReader(args.prefix)
+    header_printed = False
+    try:
+        while True:
+            records = reader.read_new()
+            if records is not None and not header_printed:
+                print(",".join(reader.schema.header))
+                header_printed = True
+            if records is not None and len(records):
+                print(reader.schema.format_csv(records), end="", flush=True)
+            if not args.follow:
+                break
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+### Per-CPU APERF/MPERF/TSC counters read through the msr driver (/dev/cpu/N/msr) ###
+#
+# The msr device maps register numbers to file offsets: pread(fd, 8, 0xE8)
+# returns IA32_APERF. Reading needs the msr module (modprobe msr) and
+# CAP_SYS_RAWIO, i.e. root. A regular file standing in for the device (a fake
+# tree under --root) cannot hold overlapping 8-byte registers at adjacent
+# offsets, so there register r is stored at byte offset 8 * r.
+import os
+import stat
+
+import numpy as np
+
+IA32_TSC = 0x10
+IA32_MPERF = 0xE7
+IA32_APERF = 0xE8
+REGISTERS = (IA32_APERF, IA32_MPERF, IA32_TSC)
+
+
+class MsrReader:
+    """Keeps /dev/cpu/N/msr open for every CPU and reads APERF, MPERF and TSC in one pass.
+
+    Counters land in a preallocated (cpus, 3) uint64 matrix; a CPU whose
+    device cannot be opened or read keeps a zero row and is flagged in
+    self.valid. available() is False when no CPU's counters could be read.
+    """
+
+    def __init__(self, cpu_cores, root="/"):
+        self.paths = [os.path.join(root, f"dev/cpu/{cpu}/msr") for cpu in range(cpu_cores)]
+        self.fds = []
+        self.offsets = []
+        for path in self.paths:
+            try:
+                fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+            except OSError:
+                fd = None
+            self.fds.append(fd)
+            scale = 1 if fd is None or stat.S_ISCHR(os.fstat(fd).st_mode) else 8
+            self.offsets.append([register * scale for register in REGISTERS])
+        self.counters = np.zeros((cpu_cores, len(REGISTERS)), dtype=np.uint64)
+        self.valid = np.zeros(cpu_cores, dtype=bool)
+        self.read()
+
+    def available(self):
+        return bool(self.valid.any())
+
+    def read(self):
+        pread = os.pread
+        counters = self.counters
+        for cpu, (fd, offsets) in enumerate(zip(self.fds, self.offsets)):
+            if fd is None:
+                continue
+            try:
+                for i, offset in enumerate(offsets):
+                    counters[cpu, i] = int.from_bytes(pread(fd, 8, offset), "little")
+                self.valid[cpu] = True
+            except OSError:
+                self.valid[cpu] = False  # CPU went offline or the register is not readable
+        return counters
+
+    def close(self):
+        for fd in self.fds:
+            if fd is not None:
+                os.close(fd)
+        self.fds = [None] * len(self.fds)
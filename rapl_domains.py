@@ -0,0 +1,15 @@
+### Which RAPL domains are whole packages, from the domain names the logger reports ###
+#
+# find_rapl_domains() lists every package followed by its sub-domains. On a
+# multi-socket host repeated sub-domain names are qualified with their
+# package ("package-1:core"), so only an exact package-N name is a top-level
+# package domain. Summing those gives total package power; adding core,
+# uncore or dram on top would count the same energy twice.
+import re
+
+PACKAGE_DOMAIN = re.compile(r"package-[0-9]+")
+
+
+def package_domain_slots(names):
+    """Indices of the top-level package domains among RAPL domain names."""
+    return [i for i, name in enumerate(names) if PACKAGE_DOMAIN.fullmatch(name)]
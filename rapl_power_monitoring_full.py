@@ -1,19 +1,36 @@
 #!/usr/bin/env python3
 
 ### This script has rapl power, p-states, c-states and time of enabled ones, a benchmark tool and cpu utilization and frequency ###
+import glob
 import os
 import re
+import resource
 import time
 import signal
 import argparse
-from datetime import datetime
+import threading
 import numpy as np
+from sysfs_pool import SysfsFilePool
+from latency_probe import LatencyProbe
+from sample_store import Schema, SampleRing, CsvSink, TeeSink, compressed_path
+from columnar_output import NpyChunkWriter
+from background_writer import BackgroundWriter, POLICIES, spill_dir_for
+from mmap_log import MmapSegmentLog
+from latency_histogram import HistogramLog
+from rotation import RotatingSink, Retention, split_suffix
+from rollup_store import RollupSink
+from sample_bus import SampleBus
+from metrics_exporter import MetricsExporter, MetricsServer
+from msr_reader import MsrReader
+from rapl_domains import package_domain_slots
+from sweep_stats import ConvergenceMonitor
 
 sleep_interval = 0.5
 output_file = "rapl_power_log.csv"
 run_duration = 0  # seconds
 
 running = True
+reopen_requested = threading.Event()  # Set by SIGHUP in daemon mode
 
 
 def signal_handler(signum, frame):
@@ -21,8 +38,13 @@ def signal_handler(signum, frame):
     running = False
 
 
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+def reopen_handler(signum, frame):
+    reopen_requested.set()
+
+
+def host_path(root, path):
+    """path inside the sysfs/procfs tree mounted at root ("/" on a real host)."""
+    return os.path.join(root, path.lstrip("/"))
 
 
 def detect_max_val(dir_path):
@@ -39,17 +61,87 @@ def read_and_trim_name(path):
         return f.read().strip()
 
 
-def get_current_governor():
-    path = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor"
-    try:
-        with open(path) as f:
-            return f.read().strip()
-    except Exception:
-        return "unknown"
+RAPL_DOMAIN_PATTERN = re.compile(r"intel-rapl(:[0-9]+)+")
+
 
+def find_rapl_domains(root="/"):
+    """Return [(domain_path, name)] for every RAPL domain, each package followed by its sub-domains.
 
-def get_pstate_status():
-    path = "/sys/devices/system/cpu/intel_pstate/status"
+    Sub-domains such as intel-rapl:0:0 (core) and intel-rapl:0:1 (uncore) are
+    found both as top-level powercap entries and nested in their package.
+    If a name repeats (e.g. "core" on a two-socket box) every sub-domain is
+    qualified with its package name, e.g. "package-1:core".
+    """
+    base_path = host_path(root, "/sys/class/powercap")
+    found = {}
+
+    def visit(dir_path, entry):
+        if not RAPL_DOMAIN_PATTERN.fullmatch(entry):
+            return
+        if not os.path.isfile(os.path.join(dir_path, "energy_uj")):
+            return
+        key = tuple(int(part) for part in entry.split(":")[1:])
+        if key in found:
+            return
+        found[key] = dir_path
+        for sub_entry in os.listdir(dir_path):
+            visit(os.path.join(dir_path, sub_entry), sub_entry)
+
+    for entry in os.listdir(base_path):
+        visit(os.path.join(base_path, entry), entry)
+
+    names = {}
+    for key, domain_path in found.items():
+        name_file = os.path.join(domain_path, "name")
+        name = read_and_trim_name(name_file) if os.path.isfile(name_file) else ""
+        names[key] = name if name else "unknown"
+    if len(set(names.values())) < len(names):
+        for key in names:
+            if len(key) > 1 and key[:1] in names:
+                names[key] = f"{names[key[:1]]}:{names[key]}"
+    return [(found[key], names[key]) for key in sorted(found)]
+
+
+class RaplReader:
+    """Cumulative energy per RAPL domain, stamped with monotonic_ns at every read.
+
+    The raw energy_uj counters wrap at each domain's own max_energy_range_uj;
+    the reader folds the wraps into unbounded cumulative counters (uJ since
+    the reader was created) so deltas stay exact across any number of wraps.
+    """
+
+    def __init__(self, pool, domains):
+        self.pool = pool
+        self.names = [name for _, name in domains]
+        self.energy_files = [os.path.join(path, "energy_uj") for path, _ in domains]
+        self.max_ranges = [detect_max_val(path) for path, _ in domains]
+        self.raw = [pool.read_int(path) or 0 for path in self.energy_files]
+        self.energy_uj = [0] * len(domains)
+        self.read_ns = [time.monotonic_ns()] * len(domains)
+        # Top-level package domains; their sum is package power (the first domain if none is named package-N)
+        self.package_slots = package_domain_slots(self.names) or [0]
+
+    def read(self):
+        read_int = self.pool.read_int
+        for i, energy_file in enumerate(self.energy_files):
+            curr = read_int(energy_file)
+            now_ns = time.monotonic_ns()
+            if curr is None:
+                continue
+            prev = self.raw[i]
+            delta = curr - prev if curr >= prev else (self.max_ranges[i] - prev + curr)
+            self.energy_uj[i] += delta
+            self.raw[i] = curr
+            self.read_ns[i] = now_ns
+
+
+def get_current_governor(pool, root="/"):
+    value = pool.read(host_path(root, "/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor"))
+    return value if value is not None else "unknown"
+
+
+def get_pstate_status(root="/"):
+    path = host_path(root, "/sys/devices/system/cpu/intel_pstate/status")
     try:
         with open(path) as f:
             return f.read().strip().replace('\r', '').replace('\n', '')
@@ -57,305 +149,1557 @@ def get_pstate_status():
         return "unknown"
 
 
-def read_pstates():
-    values = []
-    base_path = "/sys/devices/system/cpu"
-    for entry in os.listdir(base_path):
+def find_pstate_files(root="/"):
+    paths = []
+    base_path = host_path(root, "/sys/devices/system/cpu")
+    for entry in sorted(os.listdir(base_path), key=lambda entry: (len(entry), entry)):  # cpu2 before cpu10
         cpu_path = os.path.join(base_path, entry, "cpufreq", "energy_performance_preference")
         if os.path.isfile(cpu_path):
-            try:
-                with open(cpu_path) as f:
-                    values.append(f.read().strip())
-            except Exception:
-                values.append("N/A")
-    return values
+            paths.append(cpu_path)
+    return paths
 
 
-def get_cpu_cores():
-    return os.cpu_count()
+def read_pstates(pool, pstate_files):
+    values = []
+    for path in pstate_files:
+        value = pool.read(path)
+        values.append(value if value is not None else "N/A")
+    return values
 
 
-def read_cstates(cpu_cores):
-    cstate_names = {}
-    prev_cstate_times = {}
-    cstate_columns = []
+def get_cpu_cores(root="/"):
+    if root == "/":
+        return os.cpu_count()
+    cpu_dir = re.compile(r"cpu[0-9]+")
+    return sum(1 for entry in os.listdir(host_path(root, "/sys/devices/system/cpu")) if cpu_dir.fullmatch(entry))
+
+
+class CStateIndex:
+    """Precomputed (cpu, state) -> column slot and time file map for cpuidle residency.
+
+    The cpuidle tree is listed once; afterwards only the residency counters of
+    enabled states are read per sample. The index is rebuilt when
+    check_generation() sees a disable flag change: each call reads the first
+    and last CPU's flags, and every full_check_every-th call reads every CPU's.
+    """
+
+    def __init__(self, cpu_cores, pool, full_check_every=20, root="/"):
+        self.cpu_cores = cpu_cores
+        self.pool = pool
+        self.root = root
+        self.full_check_every = full_check_every
+        self.generation = 0
+        self.columns = None  # Fixed by the first build, they make up the CSV header
+        self._ticks = 0
+        self.build()
+
+    def _scan(self):
+        states = []  # (cpu, name, disable_path, time_path)
+        for cpu in range(self.cpu_cores):
+            cpuidle_path = host_path(self.root, f"/sys/devices/system/cpu/cpu{cpu}/cpuidle")
+            try:
+                state_dirs = os.listdir(cpuidle_path)
+            except OSError:
+                continue
+            for state_dir in sorted(state_dirs):
+                if not state_dir.startswith("state"):
+                    continue
+                state_path = os.path.join(cpuidle_path, state_dir)
+                name = self.pool.read(os.path.join(state_path, "name"))
+                if name is None:
+                    continue
+                states.append((cpu, name, os.path.join(state_path, "disable"),
+                               os.path.join(state_path, "time")))
+        return states
+
+    def build(self):
+        states = self._scan()
+        self.disable_paths = [disable_path for _, _, disable_path, _ in states]
+        flags = [self.pool.read(path) for path in self.disable_paths]
+        cpus_with_states = sorted({cpu for cpu, _, _, _ in states})
+        self.sentinel_paths = [disable_path for cpu, _, disable_path, _ in states
+                               if cpus_with_states and cpu in (cpus_with_states[0], cpus_with_states[-1])]
+        # Signatures hold the first byte of each flag ("0"/"1", 0 if unreadable)
+        self._scratch = bytearray(8)
+        self._sentinel_flags = bytearray(len(self.sentinel_paths))
+        self._all_flags = bytearray(len(self.disable_paths))
+        self.signature = bytes(self._signature(self.sentinel_paths, self._sentinel_flags))
+        self.full_signature = bytes(ord(flag[0]) if flag else 0 for flag in flags)
+
+        enabled_names = {cpu: [] for cpu in range(self.cpu_cores)}
+        enabled = {}
+        for (cpu, name, _, time_path), flag in zip(states, flags):
+            if flag != "0":
+                continue
+            enabled_names[cpu].append(name)
+            enabled[f"CPU{cpu}_{name}"] = time_path
 
-    for cpu in range(cpu_cores):
-        enabled_list = []
-        cpuidle_path = f"/sys/devices/system/cpu/cpu{cpu}/cpuidle"
-        if not os.path.isdir(cpuidle_path):
-            continue
-        for state_dir in os.listdir(cpuidle_path):
-            state_path = os.path.join(cpuidle_path, state_dir)
-            disable_file = os.path.join(state_path, "disable")
-            name_file = os.path.join(state_path, "name")
-            time_file = os.path.join(state_path, "time")
-
-            if not (os.path.isfile(disable_file) and os.path.isfile(name_file) and os.path.isfile(time_file)):
+        if self.columns is None:
+            self.columns = sorted(enabled)
+            self.delta_ms = np.zeros(len(self.columns))
+            old_prev = {}
+        else:
+            old_prev = dict(zip(self.slot_columns, self.prev_times.tolist()))
+
+        # Only states that have a column in the (fixed) header are read per tick
+        column_slot = {col: i for i, col in enumerate(self.columns)}
+        self.slot_columns = [key for key in sorted(enabled) if key in column_slot]
+        self.slots = np.array([column_slot[key] for key in self.slot_columns], dtype=np.intp)
+        self.time_paths = [enabled[key] for key in self.slot_columns]
+        self.curr_times = np.zeros(len(self.time_paths), dtype=np.int64)
+        self.enabled_strings = [" ".join(enabled_names[cpu]) for cpu in range(self.cpu_cores)]
+
+        self._read_times()
+        self.prev_times = self.curr_times.copy()
+        # States that survive a rebuild keep their previous reading so their delta stays exact
+        for i, key in enumerate(self.slot_columns):
+            if key in old_prev:
+                self.prev_times[i] = old_prev[key]
+        self.generation += 1
+
+    def _signature(self, paths, out):
+        # Read into a scratch buffer and fill out in place: no string per flag on the per-tick path
+        scratch = self._scratch
+        readinto = self.pool.readinto
+        for i, path in enumerate(paths):
+            out[i] = scratch[0] if readinto(path, scratch) else 0
+        return out
+
+    def _read_times(self):
+        read_int = self.pool.read_int
+        curr = self.curr_times
+        for i, path in enumerate(self.time_paths):
+            value = read_int(path)
+            if value is not None:
+                curr[i] = value
+
+    def check_generation(self):
+        """Rebuild the index if any disable flag changed; return True on rebuild."""
+        self._ticks += 1
+        changed = self._signature(self.sentinel_paths, self._sentinel_flags) != self.signature
+        if not changed and self._ticks % self.full_check_every == 0:
+            changed = self._signature(self.disable_paths, self._all_flags) != self.full_signature
+        if changed:
+            self.build()
+        return changed
+
+    def read_deltas(self):
+        """Residency per header column since the previous call, in ms."""
+        self._read_times()
+        self.delta_ms.fill(0.0)
+        self.delta_ms[self.slots] = (self.curr_times - self.prev_times) / 1_000
+        self.prev_times[:] = self.curr_times
+        return self.delta_ms
+
+
+class ProcStatReader:
+    """Per-CPU jiffy counters from /proc/stat as an int64 matrix, and utilization from one vectorized delta.
+
+    /proc/stat is read with a single pread into a reusable buffer. Only the
+    leading cpuN lines are parsed, by a single np.fromstring over their numeric
+    part, so no Python object is created per field; CPUs missing from the file (offline) keep
+    their previous counters and report 0 % utilization.
+    """
+
+    def __init__(self, pool, cpu_cores, root="/"):
+        self.pool = pool
+        self.path = host_path(root, "/proc/stat")
+        self.cpu_cores = cpu_cores
+        self.buffer = bytearray(4096 + 160 * cpu_cores)
+        self.labels = None
+        self.cpu_ids = None
+        self.jiffies = np.zeros((cpu_cores, 10), dtype=np.int64)
+        self.util = np.zeros(cpu_cores)
+        self.read()
+        self._store_previous()
+
+    def _cpu_lines(self):
+        """The cpu0..cpuN lines (with a leading newline) as bytes, or None."""
+        while True:
+            size = self.pool.readinto(self.path, self.buffer)
+            if size is None:
+                return None
+            start = self.buffer.find(b"\ncpu0")
+            # The kernel always follows the cpuN lines with the intr line
+            end = self.buffer.find(b"\nintr", max(start, 0), size)
+            if start >= 0 and end >= 0:
+                return bytes(memoryview(self.buffer)[start:end])  # One copy, not a bytearray slice and then bytes
+            if size < len(self.buffer):
+                return bytes(memoryview(self.buffer)[start:size]) if start >= 0 else None
+            self.buffer = bytearray(2 * len(self.buffer))
+
+    def read(self):
+        lines = self._cpu_lines()
+        if not lines:
+            return False
+        # Dropping the "cpu" prefixes leaves only numbers, which numpy parses in one pass in C:
+        # one row per line, the CPU number first and the jiffy counters after it. The kernel
+        # separates them with single spaces, so the count is known and numpy allocates exactly it
+        rows = lines.count(b"\n")
+        count = lines.count(b" ") + rows
+        if not rows or count % rows:
+            return False  # Truncated read
+        values = np.fromstring(lines.replace(b"\ncpu", b"\n"), dtype=np.int64, sep=" ", count=count)
+        table = values.reshape(rows, -1)
+        labels = table[:, 0]
+        if self.labels is None or not np.array_equal(labels, self.labels):
+            # CPU set changed (startup or hotplug): map CPU numbers to row indices once
+            self.labels = labels.copy()
+            keep = labels < self.cpu_cores
+            self.cpu_ids = labels[keep].astype(np.intp)
+            if np.array_equal(labels, np.arange(self.cpu_cores)):
+                # All CPUs online in order (the usual case): plain slices, so the assignment below needs no gathered copy
+                self.keep = self.cpu_ids = slice(None)
+            else:
+                self.keep = keep
+        columns = min(table.shape[1] - 1, self.jiffies.shape[1])
+        self.jiffies[self.cpu_ids, :columns] = table[self.keep, 1:columns + 1]
+        return True
+
+    def _store_previous(self):
+        jiffies = self.jiffies
+        self.prev_idle = jiffies[:, 3] + jiffies[:, 4]
+        self.prev_total = jiffies.sum(axis=1)
+
+    def update(self):
+        """Re-read /proc/stat and recompute self.util (percent busy per CPU since the last update)."""
+        if not self.read():
+            return self.util
+        jiffies = self.jiffies
+        idle = jiffies[:, 3] + jiffies[:, 4]
+        total = jiffies.sum(axis=1)
+        delta_idle = idle - self.prev_idle
+        delta_total = total - self.prev_total
+        np.divide(delta_idle, delta_total, out=self.util, where=delta_total > 0)
+        self.util[delta_total <= 0] = 1.0
+        np.subtract(1.0, self.util, out=self.util)
+        self.util *= 100.0
+        self.prev_idle = idle
+        self.prev_total = total
+        return self.util
+
+
+class CpufreqStatsReader:
+    """Per-interval frequency residency from the cumulative cpufreq/stats counters.
+
+    time_in_state lists "<kHz> <time>" for every frequency of a policy (time in
+    10 ms units) and total_trans counts frequency changes. CPUs of one policy
+    share its counters, so each policy is read once per sample. CPUs without
+    stats (e.g. intel_pstate in active mode) are left to point sampling.
+    """
+
+    def __init__(self, pool, cpu_cores, root="/"):
+        self.pool = pool
+        policies = {}
+        for cpu in range(cpu_cores):
+            stats_dir = host_path(root, f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/stats")
+            if os.path.isfile(os.path.join(stats_dir, "time_in_state")):
+                policies.setdefault(os.path.realpath(stats_dir), []).append(cpu)
+        self.policies = []  # (time_in_state, total_trans, cpus, freqs_khz)
+        self.prev_times = []
+        self.prev_trans = []
+        for stats_dir, cpus in policies.items():
+            time_file = os.path.join(stats_dir, "time_in_state")
+            trans_file = os.path.join(stats_dir, "total_trans")
+            table = self._table(time_file)
+            if table is None or not len(table):
                 continue
+            self.policies.append((time_file, trans_file, np.array(cpus, dtype=np.intp), table[:, 0]))
+            self.prev_times.append(table[:, 1])
+            self.prev_trans.append(pool.read_int(trans_file))
+        self.has_stats = np.zeros(cpu_cores, dtype=bool)
+        for _, _, cpus, _ in self.policies:
+            self.has_stats[cpus] = True
+
+    def _table(self, path):
+        data = self.pool.read_bytes(path)
+        if data is None:
+            return None
+        values = np.array(data.split(), dtype=np.int64)
+        return values.reshape(-1, 2) if len(values) % 2 == 0 else None
+
+    def read(self):
+        """Yield (cpus, freqs_khz, residency deltas in ms, transitions) per policy since the previous call.
+
+        Deltas of a policy whose counters could not be read are None.
+        """
+        for i, (time_file, trans_file, cpus, freqs) in enumerate(self.policies):
+            table = self._table(time_file)
+            if table is None or len(table) != len(freqs):
+                yield cpus, freqs, None, None
+                continue
+            delta_ms = (table[:, 1] - self.prev_times[i]) * 10.0
+            self.prev_times[i] = table[:, 1]
+            trans = self.pool.read_int(trans_file)
+            prev_trans, self.prev_trans[i] = self.prev_trans[i], trans
+            transitions = trans - prev_trans if trans is not None and prev_trans is not None else None
+            yield cpus, freqs, delta_ms, transitions
+
+
+class Collector:
+    """A source of columns that the Scheduler samples every `period` seconds.
+
+    Collectors declare structured fields of the sample row and the CSV columns
+    rendered from them, then write raw values into views of the row in place.
+    Gauges are forward-filled until the collector runs again; collectors with
+    forward_fill = False report per-interval deltas, which are cleared to NaN
+    after the row of the tick that sampled them so summing a column stays exact.
+    """
+    name = "collector"
+    forward_fill = True
+    burstable = False  # Sampled at the burst interval while an adaptive-mode burst is active
+
+    def __init__(self, period):
+        self.period = period
+        self.fields = []   # (field, dtype, shape)
+        self.columns = []  # (header, field, index, fmt, na_rep)
+        self.samples = 0
+        self.missed = 0
+
+    def bind(self, row):
+        self.row = row
+
+    def sample(self, now):
+        raise NotImplementedError
+
+    def clear(self):
+        for field, dtype, _ in self.fields:
+            if np.dtype(dtype).kind == "f":
+                self.row[field] = np.nan
+
+    def close(self):
+        pass
+
+
+class RaplCollector(Collector):
+    name = "rapl"
+    burstable = True
+
+    def __init__(self, period, reader):
+        super().__init__(period)
+        self.reader = reader
+        # Cumulative energy has no CSV column; it feeds the exporter's counters
+        self.fields = [("rapl_w", "f8", (len(reader.names),)), ("rapl_energy_j", "f8", (len(reader.names),))]
+        self.columns = [(f"{name} (W)", "rapl_w", i, "%.3f", "")
+                        for i, name in enumerate(reader.names)]
+        self.prev_energy = list(reader.energy_uj)
+        self.prev_ns = list(reader.read_ns)
+
+    def bind(self, row):
+        super().bind(row)
+        self.power = row["rapl_w"]
+        self.energy_j = row["rapl_energy_j"]
+
+    def sample(self, now):
+        reader = self.reader
+        reader.read()
+        for i in range(len(self.power)):
+            # Power over the measured time between this domain's reads, not the nominal period
+            dt_ns = reader.read_ns[i] - self.prev_ns[i]
+            delta = reader.energy_uj[i] - self.prev_energy[i]
+            self.power[i] = delta * 1_000 / dt_ns if dt_ns > 0 else 0.0  # uJ/ns -> W
+            self.prev_energy[i] = reader.energy_uj[i]
+            self.prev_ns[i] = reader.read_ns[i]
+            self.energy_j[i] = reader.energy_uj[i] / 1_000_000
+
+
+class ProcStatCollector(Collector):
+    name = "stat"
+    burstable = True
+
+    def __init__(self, period, pool, cpu_cores, root="/"):
+        super().__init__(period)
+        self.fields = [("util", "f8", (cpu_cores,))]
+        self.columns = [(f"CPU{cpu}_Utilization (%)", "util", cpu, "%.2f", "")
+                        for cpu in range(cpu_cores)]
+        self.stat = ProcStatReader(pool, cpu_cores, root)
+
+    def bind(self, row):
+        super().bind(row)
+        self.util = row["util"]
+
+    def sample(self, now):
+        np.copyto(self.util, self.stat.update())
+
+
+class CpufreqCollector(Collector):
+    """CPU frequency: the residency-weighted mean over the interval where cpufreq stats exist, else scaling_cur_freq.
+
+    With stats the collector also reports transitions per second and, with
+    residency=True, the share of the interval spent at each frequency.
+    """
+    name = "cpufreq"
+    burstable = True
+
+    def __init__(self, period, pool, cpu_cores, root="/", residency=False):
+        super().__init__(period)
+        self.pool = pool
+        self.stats = CpufreqStatsReader(pool, cpu_cores, root)
+        self.fields = [("freq_mhz", "f8", (cpu_cores,))]
+        self.columns = [(f"CPU{cpu}_Freq (MHz)", "freq_mhz", cpu, "%.1f", "N/A")
+                        for cpu in range(cpu_cores)]
+        self.freq_files = [host_path(root, f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq")
+                           for cpu in range(cpu_cores)]
+        self.point_cpus = np.flatnonzero(~self.stats.has_stats)
+        self.residency_slots = []  # Per policy: (first slot, number of frequencies) in freq_residency
+        if self.stats.policies:
+            self.fields.append(("freq_transitions", "f8", (cpu_cores,)))
+            self.columns += [(f"CPU{cpu}_PState_Transitions (/s)", "freq_transitions", cpu, "%.1f", "N/A")
+                             for cpu in range(cpu_cores)]
+            if residency:
+                residency_columns = []
+                for _, _, cpus, freqs in self.stats.policies:
+                    self.residency_slots.append((len(residency_columns), len(freqs)))
+                    residency_columns += [(cpu, khz) for cpu in cpus.tolist() for khz in freqs.tolist()]
+                self.fields.append(("freq_residency", "f8", (len(residency_columns),)))
+                self.columns += [(f"CPU{cpu}_{khz / 1000:g}MHz (%)", "freq_residency", slot, "%.1f", "")
+                                 for slot, (cpu, khz) in enumerate(residency_columns)]
+        self.last_sample = time.monotonic()
+
+    def bind(self, row):
+        super().bind(row)
+        self.freq_mhz = row["freq_mhz"]
+        if self.stats.policies:
+            self.freq_transitions = row["freq_transitions"]
+            self.freq_transitions[:] = np.nan
+        if self.residency_slots:
+            self.freq_residency = row["freq_residency"]
+
+    def _point_sample(self, cpus):
+        for cpu in cpus:
+            freq_khz = self.pool.read_int(self.freq_files[cpu])
+            self.freq_mhz[cpu] = freq_khz / 1000 if freq_khz is not None else np.nan
+
+    def sample(self, now):
+        dt, self.last_sample = now - self.last_sample, now
+        for i, (cpus, freqs, delta_ms, transitions) in enumerate(self.stats.read()):
+            total_ms = delta_ms.sum() if delta_ms is not None else 0.0
+            if total_ms > 0:
+                self.freq_mhz[cpus] = freqs @ delta_ms / total_ms / 1000
+            else:
+                self._point_sample(cpus)  # No residency accounted in this interval (or unreadable)
+            self.freq_transitions[cpus] = transitions / dt if transitions is not None and dt > 0 else np.nan
+            if self.residency_slots:
+                first, count = self.residency_slots[i]
+                shares = self.freq_residency[first:first + len(cpus) * count].reshape(len(cpus), count)
+                shares[:] = delta_ms * (100.0 / total_ms) if total_ms > 0 else np.nan
+        self._point_sample(self.point_cpus)
+
+
+class MsrCollector(Collector):
+    """Delivered frequency and C0 residency per CPU from APERF/MPERF/TSC deltas.
+
+    Effective MHz is the TSC rate scaled by dAPERF/dMPERF, i.e. the average
+    frequency while the CPU was not halted, as delivered under hardware
+    P-states. Busy is dMPERF/dTSC, the share of the interval spent in C0.
+    """
+    name = "msr"
+    burstable = True
+
+    def __init__(self, period, reader):
+        super().__init__(period)
+        self.reader = reader
+        cpu_cores = len(reader.valid)
+        self.fields = [("effective_mhz", "f8", (cpu_cores,)), ("busy", "f8", (cpu_cores,))]
+        for cpu in range(cpu_cores):
+            self.columns += [(f"CPU{cpu}_Effective_MHz", "effective_mhz", cpu, "%.1f", "N/A"),
+                             (f"CPU{cpu}_Busy (%)", "busy", cpu, "%.2f", "N/A")]
+        self.prev = reader.counters.copy()
+        self.prev_valid = reader.valid.copy()
+        self.delta = np.zeros(reader.counters.shape)
+        self.last_sample = time.monotonic()
+
+    def bind(self, row):
+        super().bind(row)
+        self.effective_mhz = row["effective_mhz"]
+        self.busy = row["busy"]
+        self.effective_mhz[:] = np.nan
+        self.busy[:] = np.nan
+
+    def sample(self, now):
+        counters = self.reader.read()
+        dt, self.last_sample = now - self.last_sample, now
+        np.copyto(self.delta, counters - self.prev)  # uint64 arithmetic, so a wrap still gives the delta
+        aperf, mperf, tsc = self.delta.T
+        ok = self.reader.valid & self.prev_valid & (mperf > 0) & (tsc > 0) & (dt > 0)
+        self.effective_mhz[:] = np.nan
+        self.busy[:] = np.nan
+        np.divide(aperf * tsc, mperf * (dt * 1e6), out=self.effective_mhz, where=ok)
+        np.divide(mperf * 100.0, tsc, out=self.busy, where=ok)
+        np.copyto(self.prev, counters)
+        np.copyto(self.prev_valid, self.reader.valid)
+
+    def close(self):
+        self.reader.close()
+
+
+class CpuidleCollector(Collector):
+    name = "cpuidle"
+    forward_fill = False
+    burstable = True
+
+    def __init__(self, period, cstate_index):
+        super().__init__(period)
+        self.cstate_index = cstate_index
+        self.fields = [("cstate_ms", "f8", (len(cstate_index.columns),))]
+        self.columns = [(f"{col} (ms)", "cstate_ms", i, "%.3f", "")
+                        for i, col in enumerate(cstate_index.columns)]
+
+    def bind(self, row):
+        super().bind(row)
+        self.cstate_ms = row["cstate_ms"]
+
+    def sample(self, now):
+        # Only residency counters are read; the topology comes from the index
+        np.copyto(self.cstate_ms, self.cstate_index.read_deltas())
+
+
+class ConfigCollector(Collector):
+    """Governor, EPP and C-state enablement, which only change between sweep runs.
+
+    The governor and EPP files are pread into one preallocated byte matrix and
+    compared with the previous tick's bytes; values are only decoded and the
+    row fields rewritten when the raw bytes change. Enabled C-state strings are
+    rewritten when the C-state index was rebuilt.
+    """
+    name = "config"
+    RAW_WIDTH = 64  # Longer than any governor or EPP name
+
+    def __init__(self, period, pool, cpu_cores, cstate_index, root="/"):
+        super().__init__(period)
+        self.pool = pool
+        self.root = root
+        self.cstate_index = cstate_index
+        self.pstate_status = get_pstate_status(root)
+        self.pstate_files = find_pstate_files(root) if self.pstate_status == "active" else []
+        self.fields = [("governor", "S16", ())]
+        self.columns = [("Governor", "governor", None, "%s", "")]
+        if self.pstate_status == "active":
+            self.fields.append(("pstate", "S24", (len(self.pstate_files),)))
+            self.columns += [(f"CPU{i}_P-State", "pstate", i, "%s", "")
+                             for i in range(len(self.pstate_files))]
+        else:
+            self.fields.append(("pstate", "S24", ()))
+            self.columns.append(("P-State", "pstate", None, "%s", ""))
+        self.fields.append(("enabled_cstates", "S64", (cpu_cores,)))
+        self.columns += [(f"CPU{cpu}_Enabled_CStates", "enabled_cstates", cpu, "%s", "")
+                         for cpu in range(cpu_cores)]
+        # Row 0 holds the governor, rows 1.. the EPP of each CPU
+        paths = [host_path(root, "/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor")] + self.pstate_files
+        self.raw = np.zeros((len(paths), self.RAW_WIDTH), dtype=np.uint8)
+        self.prev_raw = np.zeros_like(self.raw)
+        self.raw_changed = np.zeros(self.raw.shape, dtype=bool)
+        self.raw_targets = [(path, memoryview(self.raw[i])) for i, path in enumerate(paths)]
+
+    def bind(self, row):
+        super().bind(row)
+        self.enabled_cstates = row["enabled_cstates"]
+        self.cstate_generation = None  # A new row: write every field on the next sample
+        self.prev_raw.fill(0xFF)
+
+    def _decode(self, i, missing):
+        value = self.raw[i].tobytes().rstrip(b"\0").strip()
+        return value if value else missing
+
+    def sample(self, now):
+        raw = self.raw
+        raw.fill(0)  # A failed or shorter read must not leave the previous tail behind
+        readinto = self.pool.readinto
+        for path, target in self.raw_targets:
+            readinto(path, target)
+        np.not_equal(raw, self.prev_raw, out=self.raw_changed)
+        if self.raw_changed.any():
+            self.prev_raw[:] = raw
+            self.row["governor"] = self._decode(0, b"unknown")
+            if self.pstate_status == "active":
+                self.row["pstate"] = [self._decode(i, b"N/A") for i in range(1, len(raw))]
+            else:
+                self.row["pstate"] = self.pstate_status
+        self.cstate_index.check_generation()
+        if self.cstate_index.generation != self.cstate_generation:
+            self.cstate_generation = self.cstate_index.generation
+            self.enabled_cstates[:] = self.cstate_index.enabled_strings
+
+
+def find_package_thermal_zone(root="/"):
+    """temp file of the x86_pkg_temp thermal zone (else the first zone), or None."""
+    zones = sorted(glob.glob(host_path(root, "/sys/class/thermal/thermal_zone*")),
+                   key=lambda path: int(path.rsplit("thermal_zone", 1)[1]))
+    for zone in zones:
+        if read_and_trim_name(os.path.join(zone, "type")) == "x86_pkg_temp":
+            return os.path.join(zone, "temp")
+    return os.path.join(zones[0], "temp") if zones else None
+
+
+class ThermalCollector(Collector):
+    name = "thermal"
+
+    def __init__(self, period, pool, temp_path):
+        super().__init__(period)
+        self.pool = pool
+        self.temp_path = temp_path
+        self.fields = [("temp_c", "f8", ())]
+        self.columns = [("Package_Temp (C)", "temp_c", None, "%.1f", "N/A")]
+
+    def sample(self, now):
+        millidegrees = self.pool.read_int(self.temp_path)
+        self.row["temp_c"] = millidegrees / 1000 if millidegrees is not None else np.nan
+
+
+class ProbeCollector(Collector):
+    name = "probe"
+    forward_fill = False
+
+    def __init__(self, period, probe):
+        super().__init__(period)
+        self.probe = probe
+        self.fields = [("latency_ms", "f8", ())]
+        self.columns = [("Benchmark_Latency_ms", "latency_ms", None, "%.3f", "")]
+
+    def sample(self, now):
+        # Probe results that completed since the previous sample; NaN (empty) if none did
+        benchmark_latency = self.probe.drain(now)
+        self.row["latency_ms"] = benchmark_latency if benchmark_latency is not None else np.nan
+
+
+class SelfOverheadCollector(Collector):
+    """The logger's own footprint per interval: CPU time, context switches, syscalls and a power share.
+
+    CPU time and context switches are summed over the logger's own threads
+    (the sampling thread and any helper with a .rusage, e.g. the background
+    writer), so the latency probe workload is not counted. Syscalls are the read/write calls from
+    /proc/self/io (all I/O threads included), or the sysfs pool's own count
+    where that file is not readable. The power share attributes package power
+    to the logger in proportion to its share of busy CPU time in the current
+    row; subtract it from package power to compare configurations net of the
+    monitor. Runs after the RAPL and /proc/stat collectors of the same tick.
+    """
+    name = "self"
+    forward_fill = False
+
+    def __init__(self, period, pool, package_slots):
+        super().__init__(period)
+        self.pool = pool
+        self.threads = []  # Helper threads exposing their latest getrusage as .rusage
+        # Top-level package domains only (RaplReader.package_slots); sub-domains would double count
+        self.package_slots = package_slots
+        self.fields = [("self_cpu_ms", "f8", (2,)), ("self_ctx", "f8", (2,)),
+                       ("self_syscalls", "f8", ()), ("self_share_w", "f8", ())]
+        self.columns = [("Logger_CPU_User_ms", "self_cpu_ms", 0, "%.3f", ""),
+                        ("Logger_CPU_Sys_ms", "self_cpu_ms", 1, "%.3f", ""),
+                        ("Logger_Ctx_Vol", "self_ctx", 0, "%.0f", ""),
+                        ("Logger_Ctx_Invol", "self_ctx", 1, "%.0f", ""),
+                        ("Logger_Syscalls", "self_syscalls", None, "%.0f", ""),
+                        ("Logger_Energy_Share_W", "self_share_w", None, "%.4f", "")]
+        self.io_path = "/proc/self/io"  # The logger's own process, never under --root
+        self.prev = self._counters()
+        self.prev_time = time.monotonic()
+        self.cpu_ms_total = 0.0
+        self.share_j_total = 0.0
+
+    def _syscalls(self):
+        data = self.pool.read_bytes(self.io_path)
+        if data is not None:
+            fields = dict(line.split(b":") for line in data.splitlines() if b":" in line)
             try:
-                with open(disable_file) as f:
-                    disabled = f.read().strip()
-                if disabled != "0":
-                    continue
-                name = read_and_trim_name(name_file)
-                key = f"CPU{cpu}_{name}"
-                with open(time_file) as f:
-                    prev_cstate_times[key] = int(f.read().strip())
-                enabled_list.append(name)
-                cstate_columns.append(key)
-            except Exception:
+                return int(fields[b"syscr"]) + int(fields[b"syscw"])
+            except (KeyError, ValueError):
+                pass
+        return self.pool.syscalls
+
+    def _counters(self):
+        counters = np.zeros(5)
+        usages = [resource.getrusage(resource.RUSAGE_THREAD)] + [thread.rusage for thread in self.threads]
+        for usage in usages:
+            if usage is not None:
+                counters[:4] += (usage.ru_utime, usage.ru_stime, usage.ru_nvcsw, usage.ru_nivcsw)
+        counters[4] = self._syscalls()
+        return counters
+
+    def attach(self, threads):
+        """Count these helper threads from now on; re-seeds the baseline so the next delta stays exact."""
+        self.threads[:] = threads
+        self.prev = self._counters()
+
+    def bind(self, row):
+        super().bind(row)
+        self.cpu_ms = row["self_cpu_ms"]
+        self.ctx = row["self_ctx"]
+
+    def sample(self, now):
+        counters = self._counters()
+        delta = counters - self.prev
+        self.prev = counters
+        dt = now - self.prev_time
+        self.prev_time = now
+        self.cpu_ms[:] = delta[:2] * 1000
+        self.ctx[:] = delta[2:4]
+        self.row["self_syscalls"] = delta[4]
+
+        cpu_s = delta[0] + delta[1]
+        self.cpu_ms_total += cpu_s * 1000
+        package_w = sum(float(self.row["rapl_w"][i]) for i in self.package_slots)
+        busy_cpus = float(np.nansum(self.row["util"])) / 100
+        if dt > 0 and busy_cpus > 0 and not np.isnan(package_w):
+            share_w = package_w * min(cpu_s / dt / busy_cpus, 1.0)
+            self.share_j_total += share_w * dt
+        else:
+            share_w = np.nan
+        self.row["self_share_w"] = share_w
+
+
+class Scheduler:
+    """Runs each collector on its own period along one drift-free monotonic timeline.
+
+    A collector's k-th sample is due at start + k * period. If a sample is
+    missed entirely it is skipped, not replayed, and counted in collector.missed.
+    During a burst (adaptive mode) burstable collectors are also due on a
+    second grid, burst_start + j * burst_interval, until the burst ends; their
+    base grid carries on underneath and takes over again afterwards.
+    """
+
+    def __init__(self, collectors, start):
+        self.collectors = collectors
+        self.start = start
+        self.counts = [1] * len(collectors)
+        self.next_due = [start + c.period for c in collectors]
+        self.burst_start = self.burst_until = start
+        self.burst_interval = None
+        self.bursts = 0
+
+    def next_time(self):
+        return min(self.next_due)
+
+    def burst(self, now, interval, window):
+        """Sample burstable collectors every interval until now + window (extends an active burst)."""
+        if now >= self.burst_until or interval != self.burst_interval:
+            self.burst_start = now
+            self.burst_interval = interval
+            self.bursts += 1
+        self.burst_until = now + window
+        burst_due = self._next_burst(now)
+        if burst_due is None:
+            return  # Window shorter than one burst interval: no burst tick fits in it
+        for i, collector in enumerate(self.collectors):
+            if collector.burstable:
+                self.next_due[i] = min(self.next_due[i], burst_due)
+
+    def _next_burst(self, now):
+        """Next burst grid time after now, or None once the burst is over."""
+        # Round, not floor: a tick on a grid point must not get that same point back
+        steps = round((now - self.burst_start) / self.burst_interval) + 1
+        due = self.burst_start + steps * self.burst_interval
+        return due if due < self.burst_until else None
+
+    def run_due(self, now):
+        ran = []
+        # During a burst, samples due just after a burst tick join it instead of making a near-duplicate row
+        slack = self.burst_interval / 2 if now < self.burst_until else 0.0
+        for i, collector in enumerate(self.collectors):
+            if self.next_due[i] > now + slack:
                 continue
-        cstate_names[cpu] = enabled_list
-    return cstate_names, prev_cstate_times, cstate_columns
+            collector.sample(now)
+            collector.samples += 1
+            ran.append(collector)
+            next_due = self.start + self.counts[i] * collector.period
+            if next_due <= now + slack:  # This sample took the base grid slot (always so outside bursts)
+                self.counts[i] += 1
+                next_due = self.start + self.counts[i] * collector.period
+                if next_due <= now:
+                    skipped = int((now - next_due) // collector.period) + 1
+                    collector.missed += skipped
+                    self.counts[i] += skipped
+                    next_due = self.start + self.counts[i] * collector.period
+            if collector.burstable and now < self.burst_until:
+                burst_due = self._next_burst(now)
+                if burst_due is not None:
+                    next_due = min(next_due, burst_due)
+            self.next_due[i] = next_due
+        return ran
+
+
+class BurstDetector:
+    """Adaptive mode trigger: a step in package power or a steep change in mean utilization.
+
+    Samples are averaged (weighted by their dt) over windows of at least the
+    collector's base period, so the counter noise of short burst
+    samples cannot keep a burst going by itself. A power step of at least
+    power_delta W between consecutive windows, or a mean utilization slope of
+    at least util_rate percentage points per second, starts (or extends) a burst.
+    """
+
+    def __init__(self, rapl, stat, power_delta, util_rate):
+        self.rapl = rapl
+        self.stat = stat
+        self.power_delta = power_delta
+        self.util_rate = util_rate
+        self.package_slots = rapl.reader.package_slots
+        self.power = _Window()
+        self.util = _Window()
+        self.triggers = 0
+
+    def update(self, row, ran, now):
+        triggered = False
+        if self.rapl in ran:
+            power = float(sum(row["rapl_w"][i] for i in self.package_slots))
+            step = self.power.add(power, now, self.rapl.period)
+            triggered |= step is not None and abs(step) >= self.power_delta
+        if self.stat in ran:
+            step = self.util.add(float(np.mean(row["util"])), now, self.stat.period)
+            triggered |= step is not None and abs(step) / self.util.last_span >= self.util_rate
+        self.triggers += triggered
+        return triggered
+
+
+class _Window:
+    """dt-weighted mean of a signal over consecutive windows; add() returns the change between windows."""
+
+    def __init__(self):
+        self.last_time = None
+        self.total = self.elapsed = 0.0
+        self.mean = None
+        self.last_span = None
+
+    def add(self, value, now, span):
+        if self.last_time is None:
+            self.last_time = now
+            return None
+        dt = now - self.last_time
+        self.last_time = now
+        if not dt > 0 or np.isnan(value):
+            return None
+        self.total += value * dt
+        self.elapsed += dt
+        if self.elapsed < span * 0.9:
+            return None
+        mean, previous = self.total / self.elapsed, self.mean
+        self.last_span = self.elapsed
+        self.mean = mean
+        self.total = self.elapsed = 0.0
+        return None if previous is None else mean - previous
+
+
+class BufferedOutput:
+    """Rows go into a ring buffer that is handed to a background writer every buffer_size rows."""
+
+    def __init__(self, writer, dtype, buffer_size):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        self.ring = SampleRing(dtype, 4 * buffer_size)
+
+    def append(self, row):
+        self.ring.append(row)
+        if self.ring.pending >= self.buffer_size:
+            self.writer.write(self.ring.take_pending())
+
+    def close(self):
+        self.writer.write(self.ring.take_pending())
+        self.writer.close()
+
+    def print_stats(self):
+        writer = self.writer
+        print(f"Writer: {writer.written_rows} rows written, max queue depth {writer.max_depth}, "
+              f"{writer.dropped_rows} rows dropped, {writer.spilled_rows} rows spilled")
+        if isinstance(writer.sink, RotatingSink):
+            print(f"Rotation: {writer.sink.rotations} rotations, {writer.sink.deleted} segments deleted, "
+                  f"current segment {writer.sink.segment}")
+
+
+class MmapOutput(MmapSegmentLog):
+    """Rows are committed straight into mmap segments on every tick, optionally msync'ed periodically.
+
+    In daemon mode a new segment is also started by age or on SIGHUP, and
+    retention deletes the oldest segments after each rollover.
+    """
+
+    def __init__(self, prefix, schema, segment_rows, sync_interval=0, rotate_seconds=None, retention=None):
+        super().__init__(prefix, schema, segment_rows)
+        self.sync_interval = sync_interval
+        self.last_sync = time.monotonic()
+        self.rotate_seconds = rotate_seconds
+        self.retention = retention
+        self.opened_at = time.monotonic()
+        self.deleted = 0
+
+    def _roll(self):
+        super()._roll()
+        self.opened_at = time.monotonic()
+        if self.retention is not None:
+            self.deleted += len(self.retention.apply(self.list_segments(), keep=(self.segment.path,)))
+
+    def append(self, row):
+        if reopen_requested.is_set() or (
+                self.rotate_seconds and time.monotonic() - self.opened_at >= self.rotate_seconds):
+            reopen_requested.clear()
+            self._roll()
+        super().append(row)
+        if self.sync_interval > 0 and time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+            self.last_sync = time.monotonic()
+
+    def print_stats(self):
+        print(f"Mmap log: {self.rows} rows committed, {self.segment.index + 1} segments, "
+              f"{self.deleted} deleted by retention")
+
+
+class PublishingOutput:
+    """Publishes every row to live consumers (sample bus, metrics exporter) before handing it to the wrapped output."""
+
+    def __init__(self, output, publishers):
+        self.output = output
+        self.publishers = publishers
+
+    def __getattr__(self, name):
+        return getattr(self.output, name)
+
+    def append(self, row):
+        for publisher in self.publishers:
+            publisher.publish(row)
+        self.output.append(row)
+
+    def close(self):
+        for publisher in self.publishers:
+            publisher.close()
+        self.output.close()
+
+    def print_stats(self):
+        self.output.print_stats()
+        for publisher in self.publishers:
+            print(publisher.stats())
+
+
+def rotation_options(args):
+    """(rotate_seconds, rotate_bytes, retention) from the daemon options; all None outside daemon mode."""
+    if not args.daemon:
+        return None, None, None
+    rotate_seconds = args.rotate_seconds
+    rotate_bytes = args.rotate_mb * 1_000_000 if args.rotate_mb else None
+    if rotate_seconds is None and rotate_bytes is None:
+        rotate_seconds = 3600
+    retention = None
+    if args.retain_count or args.retain_hours or args.retain_mb:
+        retention = Retention(args.retain_count,
+                              args.retain_hours * 3600 if args.retain_hours else None,
+                              args.retain_mb * 1_000_000 if args.retain_mb else None)
+    return rotate_seconds, rotate_bytes, retention
+
+
+class MemoryOutput:
+    """Rows kept in memory in one growing structured array (Sampler.run without a path)."""
+
+    def __init__(self, dtype, capacity=1024):
+        self.records = np.zeros(capacity, dtype=dtype)
+        self.count = 0
+
+    def append(self, row):
+        if self.count == len(self.records):
+            self.records = np.concatenate([self.records, np.zeros_like(self.records)])
+        self.records[self.count] = row
+        self.count += 1
+
+    def close(self):
+        self.records = self.records[:self.count]
+
+    def print_stats(self):
+        print(f"Memory: {self.count} rows kept")
+
+
+def open_output(path, schema, args, buffer_size):
+    """Row output per the --format/--compress/--backpressure, daemon rotation, --bus and --metrics options."""
+    output = open_file_output(path, schema, args, buffer_size)
+    publishers = []
+    if args.bus:
+        publishers.append(SampleBus(args.bus, schema, args.bus_slots))
+    if args.metrics:
+        publishers.append(MetricsServer(MetricsExporter(schema), args.metrics))
+    return PublishingOutput(output, publishers) if publishers else output
+
+
+def open_file_output(path, schema, args, buffer_size):
+    rotate_seconds, rotate_bytes, retention = rotation_options(args)
+    if args.format == "mmap":
+        return MmapOutput(path, schema, args.segment_rows, args.mmap_sync, rotate_seconds, retention)
+
+    def open_sink(sink_path):
+        if args.format == "npy":
+            return NpyChunkWriter(sink_path, schema)
+        return CsvSink(sink_path, schema, args.compress)
+
+    if args.daemon:
+        sink = RotatingSink(path, open_sink, rotate_seconds, rotate_bytes, retention,
+                            args.compact, reopen_requested)
+    else:
+        sink = open_sink(path)
+    if args.rollup:
+        sink = TeeSink([sink, RollupSink(args.rollup, schema)])
+    writer = BackgroundWriter(sink, args.writer_queue, args.backpressure, spill_dir_for(path))
+    return BufferedOutput(writer, schema.dtype, buffer_size)
+
+
+def run_high_rate_rapl(reader, rate_hz, path, args):
+    """Log only RAPL, at rate_hz, with cumulative energy and measured-dt power per domain."""
+    domain_count = len(reader.names)
+    schema = Schema()
+    schema.add_field("monotonic_ns", "i8")
+    schema.add_field("energy_j", "f8", (domain_count,))
+    schema.add_field("power_w", "f8", (domain_count,))
+    schema.add_column("Monotonic_ns", "monotonic_ns")
+    for i, name in enumerate(reader.names):
+        schema.add_column(f"{name} (J)", "energy_j", i, "%.6f")
+        schema.add_column(f"{name} (W)", "power_w", i, "%.3f")
+    row = schema.new_row()
+    energy_j = row["energy_j"]
+    power_w = row["power_w"]
+
+    interval_ns = int(1_000_000_000 / rate_hz)
+    buffer_size = max(50, int(rate_hz))  # About one write per second
+    wall_start = time.time()
+    start_ns = time.monotonic_ns()
+    prev_energy = list(reader.energy_uj)
+    prev_ns = list(reader.read_ns)
+    samples = 0
+    overrun_count = 0
+    histograms = HistogramLog(["iteration", "lateness"], args.latency_log, args.latency_interval)
 
+    output = open_output(path, schema, args, buffer_size)
+    try:
+        while running:
+            next_ns = start_ns + (samples + 1) * interval_ns
+            if run_duration > 0 and next_ns - start_ns > run_duration * 1_000_000_000:
+                break
+            sleep_ns = next_ns - time.monotonic_ns()
+            if sleep_ns > 0:
+                time.sleep(sleep_ns / 1e9)
+            elif sleep_ns < -interval_ns:
+                overrun_count += 1
 
-def benchmark_matrix_multiplication(size=300):
-    a = np.random.rand(size, size)
-    b = np.random.rand(size, size)
-    start = time.monotonic()
-    np.dot(a, b)
-    end = time.monotonic()
-    return (end - start) * 1000  # in milliseconds
+            iteration_start_ns = time.monotonic_ns()
+            reader.read()
+            row["timestamp"] = wall_start + (next_ns - start_ns) / 1e9
+            row["monotonic_ns"] = reader.read_ns[0]
+            for i in range(domain_count):
+                dt_ns = reader.read_ns[i] - prev_ns[i]
+                delta = reader.energy_uj[i] - prev_energy[i]
+                power_w[i] = delta * 1_000 / dt_ns if dt_ns > 0 else 0.0
+                energy_j[i] = reader.energy_uj[i] / 1_000_000
+                prev_energy[i] = reader.energy_uj[i]
+                prev_ns[i] = reader.read_ns[i]
+            output.append(row)
+            samples += 1
 
+            iteration_end_ns = time.monotonic_ns()
+            histograms.record("iteration", (iteration_end_ns - iteration_start_ns) / 1e9)
+            histograms.record("lateness", (iteration_start_ns - next_ns) / 1e9)
+            histograms.maybe_dump(iteration_end_ns / 1e9)
+    finally:
+        output.close()
+        histograms.close()
 
-def read_cpu_utilization(prev_times):
-    cpu_utils = {}
-    current_times = {}
-    with open("/proc/stat") as f:
-        for line in f:
-            if not line.startswith("cpu") or line.startswith("cpu "):  # Skip aggregate "cpu "
-                continue
-            parts = line.strip().split()
-            cpu_id = parts[0]
-            values = list(map(int, parts[1:]))
-            idle = values[3] + values[4]
-            total = sum(values)
+    elapsed = (time.monotonic_ns() - start_ns) / 1e9
+    return samples, elapsed, overrun_count, output, histograms
 
-            if cpu_id in prev_times:
-                prev_idle, prev_total = prev_times[cpu_id]
-                delta_idle = idle - prev_idle
-                delta_total = total - prev_total
-                if delta_total > 0:
-                    usage = 100.0 * (1 - delta_idle / delta_total)
-                else:
-                    usage = 0.0
-                cpu_utils[cpu_id] = usage
-            current_times[cpu_id] = (idle, total)
-    return cpu_utils, current_times
 
+def print_latency(histograms):
+    print(f"Iteration time: {histograms.totals['iteration'].format()}")
+    print(f"Tick lateness: {histograms.totals['lateness'].format()}")
 
 
+def attach(schema, collector, columns=None):
+    """Add collector columns to the schema, in header order."""
+    for column in collector.columns if columns is None else columns:
+        schema.add_column(*column)
 
-def main():
-    global run_duration, output_file
 
+def build_parser():
     parser = argparse.ArgumentParser(description="RAPL power logger")
     parser.add_argument("duration", nargs='?', type=int, default=0,
                         help="Duration to run in seconds (default: unlimited)")
-    parser.add_argument("-o", "--output", default="rapl_power_log.csv", help="Output CSV file")
+    parser.add_argument("-o", "--output", default="rapl_power_log.csv",
+                        help="Output CSV file, or run directory with --format npy")
+    parser.add_argument("--format", choices=["csv", "npy", "mmap"], default="csv",
+                        help="csv (default); npy: chunked typed columns in a directory "
+                             "(load with columnar_output.read_run, export with columnar_output.py); "
+                             "mmap: crash-safe segments <output>.NNNNNN.seg (read/tail with mmap_log.py)")
+    parser.add_argument("--segment-rows", type=int, default=65536,
+                        help="Rows per mmap segment before rolling over (default: %(default)s)")
+    parser.add_argument("--mmap-sync", type=float, default=0,
+                        help="msync the mmap segment every N seconds (default: only on rollover and exit)")
+    parser.add_argument("--compress", choices=["none", "gzip", "zstd"], default="none",
+                        help="Streaming compression of CSV output (adds .gz/.zst to the file name)")
+    parser.add_argument("--writer-queue", type=int, default=64,
+                        help="Chunks the background writer may hold before backpressure applies (default: %(default)s)")
+    parser.add_argument("--backpressure", choices=POLICIES, default="block",
+                        help="When the writer queue is full: block the sampler, drop the chunk, "
+                             "or spill it to a temporary file (default: %(default)s)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run until stopped, writing rotated segments <output>-YYYYmmddTHHMMSS.<ext>; "
+                             "SIGHUP starts a new segment")
+    parser.add_argument("--rotate-seconds", type=float,
+                        help="Daemon mode: start a new segment after this many seconds (default: 3600 "
+                             "unless --rotate-mb is given)")
+    parser.add_argument("--rotate-mb", type=float, help="Daemon mode: start a new segment past this size")
+    parser.add_argument("--retain-count", type=int, help="Daemon mode: keep at most this many segments")
+    parser.add_argument("--retain-hours", type=float, help="Daemon mode: delete segments older than this")
+    parser.add_argument("--retain-mb", type=float, help="Daemon mode: cap the total size of all segments")
+    parser.add_argument("--compact", action="store_true",
+                        help="Daemon mode: gzip closed CSV segments, merge the chunks of closed npy segments")
+    parser.add_argument("--rollup",
+                        help="Also feed 1 s / 1 min / 1 h rollups into this store directory "
+                             "(query with rollup_store.py; for --format mmap use rollup_store.py ingest -f)")
+    parser.add_argument("--bus", nargs="?", const="/dev/shm/rapl-sample-bus",
+                        help="Also publish every row on a shared-memory sample bus for local consumers "
+                             "(default path: %(const)s; read with sample_bus.py)")
+    parser.add_argument("--bus-slots", type=int, default=1024,
+                        help="Rows the sample bus keeps for readers (default: %(default)s)")
+    parser.add_argument("--metrics", nargs="?", const="127.0.0.1:9464",
+                        help="Serve OpenMetrics (energy and residency counters, power/frequency/utilization "
+                             "gauges) on host:port or a UNIX socket path (default: %(const)s)")
+    parser.add_argument("--root", default="/",
+                        help="Root the sysfs/procfs paths are read from, e.g. a tree made by fake_sysfs.py")
     parser.add_argument("--benchmark", action="store_true",
                         help="Print benchmark stats after logging")
-    args = parser.parse_args()
-
-    run_duration = args.duration
-    output_file = args.output
-
-    rapl_domains = []
-    rapl_names = []
-    pattern = re.compile(r"intel-rapl:[0-9]+")
-    base_path = "/sys/class/powercap"
-
-    for entry in os.listdir(base_path):
-        if not pattern.match(entry):
-            continue
-        domain_path = os.path.join(base_path, entry)
-        energy_file = os.path.join(domain_path, "energy_uj")
-        if not os.path.isfile(energy_file):
-            continue
-        rapl_domains.append(domain_path)
-        name_file = os.path.join(domain_path, "name")
-        if os.path.isfile(name_file):
-            name = read_and_trim_name(name_file)
-            rapl_names.append(name if name else "unknown")
+    parser.add_argument("--latency-log",
+                        help="Append iteration time and tick lateness percentiles to this JSON-lines file")
+    parser.add_argument("--latency-interval", type=float, default=60.0,
+                        help="Seconds between --latency-log entries (default: %(default)s)")
+    parser.add_argument("-i", "--interval", type=float, default=sleep_interval,
+                        help="Default sampling interval in seconds for every collector (default: %(default)s)")
+    parser.add_argument("--rapl-interval", type=float, help="RAPL energy sampling interval in seconds")
+    parser.add_argument("--stat-interval", type=float, help="/proc/stat utilization sampling interval in seconds")
+    parser.add_argument("--freq-interval", type=float, help="cpufreq sampling interval in seconds")
+    parser.add_argument("--freq-residency", action="store_true",
+                        help="With cpufreq stats, add each CPU's share of time at every frequency "
+                             "(one column per frequency)")
+    parser.add_argument("--cstate-interval", type=float, help="cpuidle residency sampling interval in seconds")
+    parser.add_argument("--msr", action="store_true",
+                        help="Add effective frequency and busy %% per CPU from APERF/MPERF (/dev/cpu/N/msr)")
+    parser.add_argument("--msr-interval", type=float, help="APERF/MPERF sampling interval in seconds")
+    parser.add_argument("--temperature", action="store_true",
+                        help="Add the package temperature (x86_pkg_temp thermal zone)")
+    parser.add_argument("--temperature-interval", type=float, help="Temperature sampling interval in seconds")
+    parser.add_argument("--config-interval", type=float,
+                        help="Governor/EPP/C-state enablement sampling interval in seconds")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Burst sampling: RAPL, utilization, cpufreq and cpuidle switch to --burst-interval "
+                             "for --burst-window seconds after a sharp power or utilization change; adds an "
+                             "Interval_s column with each row's true dt")
+    parser.add_argument("--burst-interval", type=float, default=0.05,
+                        help="Sampling interval during a burst (default: %(default)s s)")
+    parser.add_argument("--burst-window", type=float, default=2.0,
+                        help="Burst length after the latest trigger (default: %(default)s s)")
+    parser.add_argument("--burst-power-delta", type=float, default=3.0,
+                        help="Package power step that triggers a burst (default: %(default)s W)")
+    parser.add_argument("--burst-util-rate", type=float, default=50.0,
+                        help="Mean utilization slope that triggers a burst (default: %(default)s %%/s)")
+    parser.add_argument("--rapl-hz", type=float,
+                        help="High-rate mode: log only RAPL energy/power at this rate (e.g. 1000)")
+    parser.add_argument("--ci-tolerance", type=float, metavar="PCT",
+                        help="Stop early once the confidence interval of mean package power is within PCT %% of "
+                             "the mean; the duration becomes the upper bound")
+    parser.add_argument("--ci-latency-tolerance", type=float, metavar="PCT",
+                        help="With --ci-tolerance, also require the benchmark latency interval within PCT %% "
+                             "(default: latency is only reported)")
+    parser.add_argument("--ci-confidence", type=float, default=0.95,
+                        help="Confidence level for --ci-tolerance (default: %(default)s)")
+    parser.add_argument("--min-duration", type=float, default=5.0,
+                        help="Shortest run with --ci-tolerance, in seconds (default: %(default)s)")
+    parser.add_argument("--no-probe", action="store_true",
+                        help="Do not run the matrix multiplication latency probe (pure observation)")
+    parser.add_argument("--probe-interval", type=float,
+                        help="Seconds between latency probe runs (default: the sampling interval)")
+    parser.add_argument("--probe-size", type=int, default=300,
+                        help="Matrix size of the latency probe (default: %(default)s)")
+    parser.add_argument("--self-overhead", action="store_true",
+                        help="Add Logger_* columns with the logger's own CPU time, context switches, "
+                             "syscalls and estimated share of package power")
+    return parser
+
+
+def setup_collectors(args, pool, rapl_reader, cpu_cores):
+    """Build the collectors, row schema and bound row for the multi-rate sampling loop."""
+    root = args.root
+
+    def period(value):
+        return value if value is not None else args.interval
+
+    cstate_index = CStateIndex(cpu_cores, pool, root=root)
+
+    rapl = RaplCollector(period(args.rapl_interval), rapl_reader)
+    stat = ProcStatCollector(period(args.stat_interval), pool, cpu_cores, root)
+    cpufreq = CpufreqCollector(period(args.freq_interval), pool, cpu_cores, root, args.freq_residency)
+    cpuidle = CpuidleCollector(period(args.cstate_interval), cstate_index)
+    config = ConfigCollector(period(args.config_interval), pool, cpu_cores, cstate_index, root)
+    collectors = [rapl, stat, cpufreq, cpuidle, config]
+
+    msr = None
+    if args.msr:
+        reader = MsrReader(cpu_cores, root)
+        if reader.available():
+            msr = MsrCollector(period(args.msr_interval), reader)
+            collectors.append(msr)
         else:
-            rapl_names.append("unknown")
-
-    if not rapl_domains:
-        print("No RAPL domains found!")
-        return 1
-
-    max_val = detect_max_val(rapl_domains[0])
-    cpu_cores = get_cpu_cores()
-
-    prev_cpu_times = {}
-    cpu_utils, prev_cpu_times = read_cpu_utilization(prev_cpu_times)
-
-    cstate_names, prev_cstate_times, cstate_columns = read_cstates(cpu_cores)
-    all_cstate_columns = set(cstate_columns)
-    pstate_status = get_pstate_status()
-
-    header = ["Timestamp"]
-    for name in rapl_names:
-        header.append(f"{name} (W)")
-    for cpu in range(cpu_cores):
-        header.append(f"CPU{cpu}_Freq (MHz)")
-        header.append(f"CPU{cpu}_Utilization (%)")
-    header.append("Governor")
-
-    if pstate_status == "active":
-        pstate_values = read_pstates()
-        for i in range(len(pstate_values)):
-            header.append(f"CPU{i}_P-State")
-    else:
-        header.append("P-State")
-
+            reader.close()
+            print("Warning: APERF/MPERF not readable (load the msr module and run as root); --msr ignored")
+
+    thermal = None
+    if args.temperature:
+        temp_path = find_package_thermal_zone(root)
+        if temp_path is not None:
+            thermal = ThermalCollector(period(args.temperature_interval), pool, temp_path)
+            collectors.append(thermal)
+        else:
+            print("Warning: no thermal zone found; --temperature ignored")
+
+    probe = None
+    if not args.no_probe:
+        probe = LatencyProbe(period(args.probe_interval), args.probe_size)
+        probe_collector = ProbeCollector(period(args.probe_interval), probe)
+        collectors.append(probe_collector)
+
+    overhead = None
+    if args.self_overhead:
+        # Last, so it sees this tick's RAPL power and utilization
+        overhead = SelfOverheadCollector(args.interval, pool, rapl_reader.package_slots)
+        collectors.append(overhead)
+
+    schema = Schema()
+    if args.adaptive:
+        # Rows come at a variable rate in adaptive mode; record each row's true dt
+        schema.add_field("interval_s", "f8")
+        schema.add_column("Interval_s", "interval_s", None, "%.4f", "")
+    for collector in collectors:
+        for field in collector.fields:
+            schema.add_field(*field)
+    attach(schema, rapl)
     for cpu in range(cpu_cores):
-        enabled_states = ",".join(cstate_names.get(cpu, []))
-        header.append(f"CPU{cpu}_Enabled_CStates")
-
-    for col in sorted(all_cstate_columns):
-        header.append(f"{col} (ms)")
-
-    header.append("Benchmark_Latency_ms")
-
-
-    prev_energy = []
-    for domain in rapl_domains:
-        with open(os.path.join(domain, "energy_uj")) as f:
-            prev_energy.append(int(f.read().strip()))
-
-    start_time = time.monotonic()  # Changed for better precision
-
-    # === BENCHMARK VARIABLES ===
-    iteration_times = []
-    overrun_count = 0
-    # ===========================
-
-    buffer = []
-    buffer_size = 50  # Adjust as needed
-    iteration = 0
-
-    with open(output_file, "w") as f:
-        f.write(",".join(header) + "\n")
-        f.flush()
-
-        while running:
-            iteration_start = time.monotonic()
-            elapsed = iteration_start - start_time
-            if run_duration > 0 and elapsed >= run_duration:
-                break
-
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-
-            line = [timestamp]
-
-            # Read RAPL
-            for i, domain in enumerate(rapl_domains):
-                with open(os.path.join(domain, "energy_uj")) as f_energy:
-                    curr = int(f_energy.read().strip())
-                prev = prev_energy[i]
-                delta = curr - prev if curr >= prev else (max_val - prev + curr)
-                power = delta / 1_000_000 / sleep_interval
-                line.append(f"{power:.3f}")
-                prev_energy[i] = curr
-
-            # Read frequency and utilization together
-            cpu_utils, prev_cpu_times = read_cpu_utilization(prev_cpu_times)
-
-            for cpu in range(cpu_cores):
-                # Frequency
-                freq_file = f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq"
-                try:
-                    with open(freq_file) as f_freq:
-                        freq_khz = int(f_freq.read().strip())
-                    freq_mhz = freq_khz / 1000
-                    line.append(f"{freq_mhz:.1f}")
-                except Exception:
-                    line.append("N/A")
-
-                # Utilization
-                usage = cpu_utils.get(f"cpu{cpu}", 0.0)
-                line.append(f"{usage:.2f}")
-
-            line.append(get_current_governor())
-
-            if pstate_status == "active":
-                pstate_values = read_pstates()
-                line.extend(pstate_values)
-            else:
-                line.append(pstate_status)
-
-            # Read C-states
-            cstate_names, current_cstate_times, current_cstate_columns = read_cstates(cpu_cores)
-            all_cstate_columns.update(current_cstate_columns)
-
-            for cpu in range(cpu_cores):
-                enabled_states = " ".join(cstate_names.get(cpu, []))
-                line.append(enabled_states)
-
-            delta_cstate_values = {}
-            for cpu in range(cpu_cores):
-                for name in cstate_names.get(cpu, []):
-                    key = f"CPU{cpu}_{name}"
-                    curr_time = current_cstate_times.get(key, 0)
-                    prev_time = prev_cstate_times.get(key, 0)
-                    delta_us = curr_time - prev_time
-                    delta_s = delta_us / 1_000
-                    delta_cstate_values[key] = delta_s
-                    prev_cstate_times[key] = curr_time
-
-            for col in sorted(all_cstate_columns):
-                line.append(f"{delta_cstate_values.get(col, 0.0):.3f}")
-
-            benchmark_latency = benchmark_matrix_multiplication()
-            line.append(f"{benchmark_latency:.3f}")
-
-            buffer.append(",".join(line))
-
-            if len(buffer) >= buffer_size:
-                f.write("\n".join(buffer) + "\n")
-                f.flush()
-                buffer.clear()
-
-            iteration_end = time.monotonic()
-            iteration_duration = iteration_end - iteration_start
-            iteration_times.append(iteration_duration)
-
-            next_sample_time = start_time + (iteration + 1) * sleep_interval
-            sleep_time = next_sample_time - iteration_end
+        attach(schema, cpufreq, [cpufreq.columns[cpu]])
+        attach(schema, stat, [stat.columns[cpu]])
+    attach(schema, cpufreq, cpufreq.columns[cpu_cores:])  # Transitions and residency shares, with cpufreq stats
+    if msr is not None:
+        attach(schema, msr)
+    if thermal is not None:
+        attach(schema, thermal)
+    attach(schema, config)
+    attach(schema, cpuidle)
+    if probe is not None:
+        attach(schema, probe_collector)
+    if overhead is not None:
+        attach(schema, overhead)
+
+    # Collectors write into views of this single record; each emitted tick copies it into the output
+    row = schema.new_row()
+    for collector in collectors:
+        collector.bind(row)
+
+    # Gauges start out filled so that rows emitted before a slow collector's first sample are complete
+    config.sample(time.monotonic())
+    cpufreq.sample(time.monotonic())
+    return collectors, schema, row, probe
+
+
+class SamplerRun:
+    """Outcome of one Sampler.run(): the rows (in memory, or the path they were written to) and loop statistics."""
+
+    def __init__(self, schema, path, records, output, histograms, elapsed, iterations, overruns, syscalls,
+                 triggers=None, bursts=None, monitor=None):
+        self.schema = schema
+        self.path = path
+        self.records = records
+        self.output = output
+        self.histograms = histograms
+        self.elapsed = elapsed
+        self.iterations = iterations
+        self.overruns = overruns
+        self.syscalls = syscalls
+        self.triggers = triggers
+        self.bursts = bursts
+        self.monitor = monitor  # The run's stop condition (ConvergenceMonitor, SettleDetector), if any
+
+    def frame(self):
+        """The in-memory rows as a pandas DataFrame with the CSV header's columns."""
+        import pandas as pd
+        from datetime import datetime
+        records = self.records
+        data = {"Timestamp": pd.to_datetime([datetime.fromtimestamp(t) for t in records["timestamp"].tolist()])}
+        for header, field, index, _, _ in self.schema.columns:
+            values = records[field] if index is None else records[field][:, index]
+            data[header] = np.char.decode(values, "ascii") if values.dtype.kind == "S" else values
+        return pd.DataFrame(data)
+
+
+class Sampler:
+    """The multi-rate sampling loop as a reusable object: discover the host once, then measure any number of times.
+
+    run(duration, path) measures in the calling thread and writes rows to path
+    (per --format) or, without a path, keeps them in memory. start() runs the
+    same loop on a background thread until stop() or the duration. Options are
+    the command line's, as keyword arguments, e.g.
+    Sampler(interval=0.1, no_probe=True). Collectors are rebuilt only when the
+    intel_pstate mode or the set of enabled C-states changed, as those define
+    the columns; otherwise a run only re-primes the counters. With
+    ci_tolerance a run ends early once package power (and, with
+    ci_latency_tolerance, benchmark latency) has converged (see
+    sweep_stats.py); the duration is then the upper bound.
+    """
+
+    def __init__(self, args=None, **options):
+        if args is None:
+            args = build_parser().parse_args([])
+        for name, value in options.items():
+            if not hasattr(args, name):
+                raise TypeError(f"Unknown sampler option {name!r}")
+            setattr(args, name, value)
+        if args.burst_window < args.burst_interval:
+            raise ValueError("burst_window must be at least burst_interval")
+        self.args = args
+        rapl_domains = find_rapl_domains(args.root)
+        if not rapl_domains:
+            raise RuntimeError("No RAPL domains found!")
+        self.cpu_cores = get_cpu_cores(args.root)
+        # Every per-tick sysfs read goes through this pool of persistent descriptors
+        self.pool = SysfsFilePool()
+        self.rapl_reader = RaplReader(self.pool, rapl_domains)
+        self.collectors = []
+        self.layout = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._result = None
+
+    def _layout(self):
+        if not self.collectors:
+            return None
+        cstate_index = next(c for c in self.collectors if isinstance(c, ConfigCollector)).cstate_index
+        return get_pstate_status(self.args.root), tuple(self.pool.read(path) for path in cstate_index.disable_paths)
+
+    def _prepare(self):
+        layout = self._layout()
+        if layout is None or layout != self.layout:
+            for collector in self.collectors:
+                collector.close()
+            self.collectors, self.schema, self.row, self.probe = setup_collectors(
+                self.args, self.pool, self.rapl_reader, self.cpu_cores)
+            self.layout = self._layout()
+        # Fresh baselines, so the first deltas do not span the time since the previous run
+        now = time.monotonic()
+        for collector in self.collectors:
+            collector.sample(now)
+            if not collector.forward_fill:
+                collector.clear()
+            collector.samples = collector.missed = 0
+
+    def run(self, duration=0, path=None, monitor=None):
+        """Measure for duration seconds (0: until stop() or a signal); return a SamplerRun.
+
+        monitor, if given, replaces the --ci-tolerance one: begin(schema) is
+        called before the first row and the run ends once update(row) is True.
+        """
+        self._stop.clear()
+        return self._run(duration, path, monitor)
+
+    def start(self, duration=0, path=None, monitor=None):
+        """Start run() on a background thread."""
+        self._stop.clear()
+        self._result = None
+        self._thread = threading.Thread(target=self._background_run, args=(duration, path, monitor), name="sampler")
+        self._thread.start()
+
+    def _background_run(self, duration, path, monitor):
+        self._result = self._run(duration, path, monitor)
+
+    def stop(self):
+        """Stop a start()ed run and return its SamplerRun."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self._result
+
+    def _run(self, duration, path, monitor):
+        args = self.args
+        self._prepare()
+        collectors, schema, row, probe = self.collectors, self.schema, self.row, self.probe
+        pool = self.pool
+        buffer_size = 50  # Adjust as needed
+        if path is not None and args.format == "csv":
+            path = compressed_path(path, args.compress)
+
+        start_time = time.monotonic()  # Changed for better precision
+        wall_start = time.time()
+        if probe is not None:
+            probe.start()
+        scheduler = Scheduler(collectors, start_time)
+        detector = None
+        if args.adaptive:
+            rapl = next(c for c in collectors if isinstance(c, RaplCollector))
+            stat = next(c for c in collectors if isinstance(c, ProcStatCollector))
+            detector = BurstDetector(rapl, stat, args.burst_power_delta, args.burst_util_rate)
+            previous_start = None
+        if monitor is None and args.ci_tolerance:
+            latency_tolerance = args.ci_latency_tolerance / 100 if args.ci_latency_tolerance else None
+            monitor = ConvergenceMonitor(args.ci_tolerance / 100, args.ci_confidence, args.min_duration,
+                                         latency_tolerance=latency_tolerance)
+        if monitor is not None:
+            monitor.begin(schema)
+
+        # === BENCHMARK VARIABLES ===
+        iteration_count = 0
+        overrun_count = 0
+        total_syscalls = 0
+        histograms = HistogramLog(["iteration", "lateness"], args.latency_log, args.latency_interval)
+        # ===========================
+
+        output = open_output(path, schema, args, buffer_size) if path is not None else MemoryOutput(schema.dtype)
+        writer = getattr(output, "writer", None)  # Background writer thread, if the output has one
+        for collector in collectors:
+            if isinstance(collector, SelfOverheadCollector):
+                collector.attach([writer] if writer is not None else [])
+        try:
+            while running and not self._stop.is_set():
+                tick_time = scheduler.next_time()
+                if duration > 0 and tick_time - start_time > duration:
+                    break
+                sleep_time = tick_time - time.monotonic()
+                if sleep_time > 0 and self._stop.wait(sleep_time):
+                    break
+                if not running:
+                    break
+
+                iteration_start = time.monotonic()
+                syscalls_start = pool.syscalls
+
+                ran = scheduler.run_due(iteration_start)
+                row["timestamp"] = wall_start + (tick_time - start_time)
+                if detector is not None:
+                    row["interval_s"] = iteration_start - previous_start if previous_start is not None else np.nan
+                    previous_start = iteration_start
+                    if detector.update(row, ran, iteration_start):
+                        scheduler.burst(iteration_start, args.burst_interval, args.burst_window)
+                output.append(row)
+                stop = monitor is not None and monitor.update(row)
+                for collector in ran:
+                    if not collector.forward_fill:
+                        collector.clear()
+
+                iteration_end = time.monotonic()
+                iteration_count += 1
+                histograms.record("iteration", iteration_end - iteration_start)
+                histograms.record("lateness", iteration_start - tick_time)  # Jitter against the schedule
+                histograms.maybe_dump(iteration_end)
+                total_syscalls += pool.syscalls - syscalls_start
+
+                if iteration_end > scheduler.next_time():
+                    overrun_count += 1
+                if stop:
+                    break
+
+        finally:
+            if probe is not None:
+                probe.stop()
+            output.close()  # Final flush
+            histograms.close()
+
+        return SamplerRun(schema, path, output.records if path is None else None, output, histograms,
+                          time.monotonic() - start_time, iteration_count, overrun_count, total_syscalls,
+                          detector.triggers if detector is not None else None, scheduler.bursts,
+                          monitor)
+
+    def print_benchmark(self, run):
+        if not run.iterations:
+            print("No iterations recorded.")
+            return
+        print(f"--- Benchmark summary ---")
+        print(f"Total iterations: {run.iterations}")
+        print_latency(run.histograms)
+        print(f"Number of overruns (iteration longer than interval): {run.overruns}")
+        if run.triggers is not None:
+            print(f"Adaptive sampling: {run.triggers} triggers, {run.bursts} bursts")
+        if run.monitor is not None:
+            print(run.monitor.summary())
+        print(f"Average sysfs syscalls per iteration: {run.syscalls / run.iterations:.1f}")
+        run.output.print_stats()
+        for collector in self.collectors:
+            print(f"Collector {collector.name}: period {collector.period} s, "
+                  f"{collector.samples} samples, {collector.missed} missed")
+            if isinstance(collector, SelfOverheadCollector):
+                print(f"Logger CPU time: {collector.cpu_ms_total:.1f} ms "
+                      f"({collector.cpu_ms_total / 10 / run.elapsed:.2f} % of one CPU), "
+                      f"estimated energy share {collector.share_j_total:.3f} J "
+                      f"({collector.share_j_total / run.elapsed:.4f} W)")
+
+    def close(self):
+        for collector in self.collectors:
+            collector.close()
+        self.collectors = []
+        self.pool.close()
+
+
+def saved_location(path, args):
+    """Where the data of a run logged to path ended up, for the closing message."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if args.format == "mmap":
+        return f"Data saved in segments {os.path.basename(path)}.NNNNNN.seg in {directory}"
+    if args.daemon:
+        base, suffix = split_suffix(os.path.basename(path))
+        return f"Data saved in rotated segments {base}-<YYYYmmddTHHMMSS>{suffix} in {directory}"
+    return f"Data saved in {path}"
 
-            if sleep_time < 0:
-                overrun_count += 1
-                sleep_time = 0
 
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+def main():
+    global run_duration, output_file, sleep_interval
 
-            iteration += 1
+    parser = build_parser()
+    args = parser.parse_args()
 
-        # Final flush
-        if buffer:
-            f.write("\n".join(buffer) + "\n")
-            f.flush()
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    if args.daemon:
+        signal.signal(signal.SIGHUP, reopen_handler)
+        if args.duration:
+            parser.error("--daemon runs until stopped; do not give a duration")
+    if args.rollup and args.format == "mmap":
+        parser.error("--rollup needs --format csv or npy; feed a mmap log with rollup_store.py ingest -f")
+    if args.burst_window < args.burst_interval:
+        parser.error("--burst-window must be at least --burst-interval")
 
-    # === PRINT BENCHMARK RESULTS ===
-    if args.benchmark:
-        if iteration_times:
-            avg_time = sum(iteration_times) / len(iteration_times)
-            min_time = min(iteration_times)
-            max_time = max(iteration_times)
+    run_duration = args.duration
+    output_file = args.output
+    if args.format == "csv":
+        output_file = compressed_path(output_file, args.compress)
+    sleep_interval = args.interval
+
+    if args.rapl_hz:
+        rapl_domains = find_rapl_domains(args.root)
+        if not rapl_domains:
+            print("No RAPL domains found!")
+            return 1
+        pool = SysfsFilePool()
+        rapl_reader = RaplReader(pool, rapl_domains)
+        samples, elapsed, overruns, output, histograms = run_high_rate_rapl(
+            rapl_reader, args.rapl_hz, output_file, args)
+        if args.benchmark:
             print(f"--- Benchmark summary ---")
-            print(f"Total iterations: {len(iteration_times)}")
-            print(f"Average iteration time: {avg_time:.3f} s")
-            print(f"Min iteration time: {min_time:.3f} s")
-            print(f"Max iteration time: {max_time:.3f} s")
-            print(f"Number of overruns (iteration longer than interval): {overrun_count}")
-        else:
-            print("No iterations recorded.")
+            print(f"Samples: {samples} in {elapsed:.3f} s ({samples / elapsed if elapsed else 0:.1f} Hz achieved)")
+            print(f"Number of overruns (late by more than one interval): {overruns}")
+            print_latency(histograms)
+            output.print_stats()
+        pool.close()
+        print(f"Measurement complete. {saved_location(output_file, args)}")
+        return 0
 
-    print(f"Measurement complete. Data saved in {output_file}")
+    try:
+        sampler = Sampler(args)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    try:
+        run = sampler.run(args.duration, args.output)
+        if args.benchmark:
+            sampler.print_benchmark(run)
+        elif run.monitor is not None:
+            print(run.monitor.summary())
+    finally:
+        sampler.close()
+    print(f"Measurement complete. {saved_location(run.path, args)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,383 @@
+### Multi-resolution rollup store (1 s -> 1 min -> 1 h) of logged columns, with fast range queries ###
+#
+# Store layout (a directory):
+#   meta.json                 {"version": 1, "tiers": [1, 60, 3600], "columns": [header, ...]}
+#   tier-<seconds>/YYYYMMDD.bin   raw little-endian records of tier_dtype(len(columns)), one file per UTC day
+#
+# Each record summarizes one bucket of <seconds> starting at `start` (epoch
+# seconds): the rows it covers and, per column, the count of valid values,
+# min, max, sum and integral over time (value x seconds, i.e. energy in J for
+# power columns in W). Finer tiers feed coarser ones as buckets complete, and
+# old day files are deleted per tier retention, so the store keeps detail for
+# recent data and only hourly summaries for old data. A query reads the
+# coarsest tier that satisfies the requested resolution and re-aggregates it.
+#
+#   python3 rollup_store.py ingest rollups/ run.csv        # also .npyd runs and mmap log prefixes (-f follows)
+#   python3 rollup_store.py query rollups/ --start "2026-10-13 14:00" --end "2026-10-13 18:00" \
+#       --resolution 300 --columns "package-0 (W)"
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+TIERS = (1, 60, 3600)
+DEFAULT_RETENTION = {1: 7 * 86400, 60: 90 * 86400, 3600: None}  # seconds; None keeps forever
+MAX_GAP = 5.0  # Seconds; longer gaps between rows (logger down) are not integrated
+META_FILE = "meta.json"
+DAY = 86400
+STATS = (("n", np.add), ("min", np.fmin), ("max", np.fmax), ("sum", np.add), ("integral", np.add))
+
+
+def tier_dtype(count, work=False):
+    """On-disk bucket record; work=True is the float64 variant used while aggregating."""
+    value = "f8" if work else "<f4"
+    return np.dtype([("start", "<f8"), ("rows", "<i4"), ("n", "<i4", (count,)),
+                     ("min", value, (count,)), ("max", value, (count,)),
+                     ("sum", value, (count,)), ("integral", value, (count,))])
+
+
+def combine(buckets, resolution):
+    """Merge time-sorted buckets (or rows as one-row buckets) into buckets of `resolution` seconds."""
+    if len(buckets) == 0:
+        return buckets
+    ids = np.floor(buckets["start"] / resolution)
+    boundaries = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    out = np.zeros(len(boundaries), dtype=buckets.dtype)
+    out["start"] = ids[boundaries] * resolution
+    out["rows"] = np.add.reduceat(buckets["rows"], boundaries)
+    for name, ufunc in STATS:
+        out[name] = ufunc.reduceat(buckets[name], boundaries, axis=0)
+    return out
+
+
+def numeric_columns(schema):
+    """(header, field, index) of every float column of a logger Schema."""
+    kinds = {name: np.dtype(dtype).kind for name, dtype, _ in schema.fields}
+    return [(header, field, index) for header, field, index, _, _ in schema.columns if kinds[field] == "f"]
+
+
+class RollupStore:
+    """Reads (and holds the layout of) a rollup store directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.tiers = tuple(meta["tiers"])
+        self.columns = list(meta["columns"])
+        self.dtype = tier_dtype(len(self.columns))
+
+    @staticmethod
+    def create(path, columns, tiers=TIERS):
+        """Open the store at path, creating it for columns; an existing store must have the same columns."""
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            store = RollupStore(path)
+            if store.columns != list(columns) or store.tiers != tuple(tiers):
+                raise ValueError(f"Rollup store {path} was created for other columns or tiers; use a new directory")
+            return store
+        for tier in tiers:
+            os.makedirs(os.path.join(path, f"tier-{tier}"), exist_ok=True)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump({"version": 1, "tiers": list(tiers), "columns": list(columns)}, f, indent=1)
+        os.replace(meta_path + ".tmp", meta_path)
+        return RollupStore(path)
+
+    def day_files(self, tier):
+        return sorted(glob.glob(os.path.join(self.path, f"tier-{tier}", "[0-9]" * 8 + ".bin")))
+
+    def read_tier(self, tier, start, end):
+        """Buckets of one tier with start in [start, end), time-sorted, as float64 work records."""
+        first_day = time.strftime("%Y%m%d", time.gmtime(start))
+        last_day = time.strftime("%Y%m%d", time.gmtime(end))
+        parts = []
+        for path in self.day_files(tier):
+            day = os.path.basename(path)[:8]
+            if first_day <= day <= last_day:
+                parts.extend(self._read_range(path, start, end))
+        work = tier_dtype(len(self.columns), work=True)
+        if not parts:
+            return np.zeros(0, dtype=work)
+        records = np.concatenate(parts).astype(work)
+        # Restarts can leave a partial and a later bucket with the same start; merge them
+        return combine(records[np.argsort(records["start"], kind="stable")], tier)
+
+    def _read_range(self, path, start, end, chunk_rows=65536):
+        """Copies of the records of one day file with start in [start, end), read chunk by chunk.
+
+        The file is memory-mapped rather than loaded: a 1 s tier day on a
+        many-CPU host runs to gigabytes. Files are scanned in full, as
+        ingesting an older run after a newer one appends out of time order.
+        """
+        rows = os.path.getsize(path) // self.dtype.itemsize  # A torn last record is ignored
+        if rows == 0:
+            return []
+        records = np.memmap(path, dtype=self.dtype, mode="r", shape=(rows,))
+        parts = []
+        for begin in range(0, rows, chunk_rows):
+            chunk = records[begin:begin + chunk_rows]
+            starts = chunk["start"]
+            selected = chunk[(starts >= start) & (starts < end)]
+            if len(selected):
+                parts.append(np.array(selected))
+        del records  # Unmap
+        return parts
+
+    def earliest(self, tier):
+        files = self.day_files(tier)
+        for path in files:
+            records = np.fromfile(path, dtype=self.dtype, count=1)
+            if len(records):
+                return float(records["start"][0])
+        return None
+
+    def choose_tier(self, start, resolution):
+        """The coarsest tier no coarser than resolution, unless retention already dropped its data from start.
+
+        Coverage is judged against the coarsest tier, which is kept longest:
+        a finer tier is usable if it starts no later than the range (or than
+        the coarsest tier's data, when the range begins before any data).
+        """
+        finer = [tier for tier in self.tiers if tier <= resolution] or [self.tiers[0]]
+        preferred = finer[-1]
+        coarsest = self.tiers[-1]
+        reference = self.earliest(coarsest)
+        if reference is None:
+            return preferred
+        needed = max(start, reference + coarsest)
+        for tier in [preferred] + [tier for tier in self.tiers if tier > preferred]:
+            earliest = self.earliest(tier)
+            if earliest is not None and earliest <= needed:
+                return tier
+        return coarsest
+
+    def query(self, start, end, resolution=None, max_points=1000):
+        """(buckets of `resolution` seconds covering [start, end), tier read); resolution defaults to max_points buckets."""
+        if resolution is None:
+            resolution = max((end - start) / max_points, self.tiers[0])
+        tier = self.choose_tier(start, resolution)
+        return combine(self.read_tier(tier, start, end), max(resolution, tier)), tier
+
+    def query_frame(self, start, end, resolution=None, columns=None, stats=("mean",)):
+        """The query as a DataFrame: Timestamp (local) plus "<column> <stat>" for mean/min/max/energy."""
+        import pandas as pd
+
+        buckets, _ = self.query(start, end, resolution)
+        indices = [self.columns.index(column) for column in (columns or self.columns)]
+        frame = {"Timestamp": pd.to_datetime([datetime.fromtimestamp(t) for t in buckets["start"].tolist()])}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for i in indices:
+                column = self.columns[i]
+                for stat in stats:
+                    if stat == "mean":
+                        frame[f"{column} mean"] = buckets["sum"][:, i] / buckets["n"][:, i]
+                    elif stat == "energy":
+                        # Value x seconds: joules for power columns, a plain time integral otherwise
+                        label = "energy (J)" if column.endswith(("(W)", "_W")) else "integral"
+                        frame[f"{column} {label}"] = buckets["integral"][:, i]
+                    else:
+                        frame[f"{column} {stat}"] = buckets[stat][:, i]
+        return pd.DataFrame(frame)
+
+
+class RollupWriter:
+    """Turns rows (timestamps plus a values matrix) into buckets for every tier and appends completed ones.
+
+    Only one open bucket per tier is kept in memory, so memory is constant.
+    """
+
+    def __init__(self, path, columns, tiers=TIERS, retention=None):
+        self.store = RollupStore.create(path, columns, tiers)
+        self.tiers = self.store.tiers
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+        self.work_dtype = tier_dtype(len(columns), work=True)
+        self.open = [None] * len(self.tiers)
+        self.prev_timestamp = None
+        self.last_day = {}
+
+    def add(self, timestamps, values):
+        """Add rows: timestamps (N,) in epoch seconds, values (N, columns) with NaN for missing."""
+        if len(timestamps) == 0:
+            return
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        previous = timestamps[0] if self.prev_timestamp is None else self.prev_timestamp
+        dt = np.diff(timestamps, prepend=previous)
+        dt[(dt < 0) | (dt > MAX_GAP)] = 0.0
+        self.prev_timestamp = timestamps[-1]
+
+        rows = np.zeros(len(timestamps), dtype=self.work_dtype)
+        rows["start"] = timestamps
+        rows["rows"] = 1
+        valid = ~np.isnan(values)
+        rows["n"] = valid
+        rows["min"] = values
+        rows["max"] = values
+        filled = np.where(valid, values, 0.0)
+        rows["sum"] = filled
+        rows["integral"] = filled * dt[:, None]
+        self._feed(0, rows)
+
+    def _feed(self, level, buckets):
+        resolution = self.tiers[level]
+        if self.open[level] is not None:
+            buckets = np.concatenate([self.open[level], buckets])
+        combined = combine(buckets, resolution)
+        done, self.open[level] = combined[:-1], combined[-1:]
+        self._complete(level, done)
+
+    def _complete(self, level, done):
+        if len(done) == 0:
+            return
+        self._append(self.tiers[level], done)
+        if level + 1 < len(self.tiers):
+            self._feed(level + 1, done)
+
+    def _append(self, tier, buckets):
+        days = np.floor(buckets["start"] / DAY)
+        boundaries = np.flatnonzero(np.r_[True, days[1:] != days[:-1], True])
+        for begin, end in zip(boundaries[:-1], boundaries[1:]):
+            day = time.strftime("%Y%m%d", time.gmtime(buckets["start"][begin]))
+            path = os.path.join(self.store.path, f"tier-{tier}", f"{day}.bin")
+            with open(path, "ab") as f:
+                f.write(buckets[begin:end].astype(self.store.dtype).tobytes())
+            if self.last_day.get(tier) != day:
+                self.last_day[tier] = day
+                self._expire(tier)
+
+    def _expire(self, tier):
+        max_age = self.retention.get(tier)
+        if max_age is None:
+            return
+        cutoff = time.strftime("%Y%m%d", time.gmtime(time.time() - max_age - DAY))
+        for path in self.store.day_files(tier):
+            if os.path.basename(path)[:8] < cutoff:
+                os.remove(path)
+
+    def close(self):
+        """Write every open (partial) bucket; a later run's bucket with the same start is merged at query time."""
+        for level in range(len(self.tiers)):
+            bucket, self.open[level] = self.open[level], None
+            if bucket is not None:
+                self._complete(level, bucket)
+
+
+class RollupSink:
+    """Sink (like CsvSink) feeding the logger's flushed records into a rollup store."""
+
+    def __init__(self, path, schema, tiers=TIERS, retention=None):
+        self.columns = numeric_columns(schema)
+        self.writer = RollupWriter(path, [header for header, _, _ in self.columns], tiers, retention)
+
+    def values(self, records):
+        """(rows, columns) matrix of the numeric columns of records (a structured array or dict of arrays)."""
+        matrix = np.empty((len(records["timestamp"]), len(self.columns)))
+        for i, (_, field, index) in enumerate(self.columns):
+            matrix[:, i] = records[field] if index is None else records[field][:, index]
+        return matrix
+
+    def write(self, records):
+        self.writer.add(records["timestamp"], self.values(records))
+
+    def close(self):
+        self.writer.close()
+
+
+def ingest(store_path, run_path, follow=False, poll=1.0, chunk_rows=10000):
+    """Feed a logged run (CSV, .npyd directory or mmap log prefix) into the store."""
+    if glob.glob(glob.escape(run_path) + ".[0-9]*.seg"):
+        from mmap_log import MmapLogReader
+
+        reader = MmapLogReader(run_path)
+        sink = None
+        try:
+            while True:
+                records = reader.read_new()
+                if records is not None and sink is None:
+                    sink = RollupSink(store_path, reader.schema)
+                if records is not None:
+                    for begin in range(0, len(records), chunk_rows):
+                        sink.write(records[begin:begin + chunk_rows])
+                if not follow:
+                    break
+                time.sleep(poll)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reader.close()
+            if sink is not None:
+                sink.close()
+        return
+
+    if os.path.isdir(run_path):
+        from columnar_output import read_schema, iter_chunks
+
+        sink = RollupSink(store_path, read_schema(run_path))
+        for chunk in iter_chunks(run_path):
+            sink.write(chunk)
+        sink.close()
+        return
+
+    import pandas as pd
+    from columnar_output import read_run
+
+    df = read_run(run_path)
+    columns = [column for column in df.columns if column != "Timestamp" and df[column].dtype.kind == "f"]
+    local = pd.to_datetime(df["Timestamp"]).dt.tz_localize(datetime.now().astimezone().tzinfo)
+    timestamps = (local - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+    writer = RollupWriter(store_path, columns)
+    values = df[columns].to_numpy(dtype=np.float64)
+    for begin in range(0, len(df), chunk_rows):
+        writer.add(timestamps[begin:begin + chunk_rows], values[begin:begin + chunk_rows])
+    writer.close()
+
+
+def parse_time(text):
+    """Local date/time ("2026-10-13 14:00") or epoch seconds."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-resolution rollups of logged power data")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Add a logged run (CSV, .npyd or mmap prefix)")
+    ingest_parser.add_argument("store")
+    ingest_parser.add_argument("run")
+    ingest_parser.add_argument("-f", "--follow", action="store_true", help="Keep following a live mmap log")
+    query_parser = commands.add_parser("query", help="Print a time range as CSV")
+    query_parser.add_argument("store")
+    query_parser.add_argument("--start", required=True, help="Local time or epoch seconds")
+    query_parser.add_argument("--end", required=True, help="Local time or epoch seconds")
+    query_parser.add_argument("--resolution", type=float, help="Bucket size in seconds (default: about 1000 points)")
+    query_parser.add_argument("--columns", nargs="+", help="Column headers (default: all)")
+    query_parser.add_argument("--stats", nargs="+", default=["mean"], choices=["mean", "min", "max", "energy"])
+    info_parser = commands.add_parser("info", help="Show tiers, columns and time coverage")
+    info_parser.add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest(args.store, args.run, args.follow)
+    elif args.command == "query":
+        store = RollupStore(args.store)
+        start, end = parse_time(args.start), parse_time(args.end)
+        frame = store.query_frame(start, end, args.resolution, args.columns, args.stats)
+        print(frame.to_csv(index=False), end="")
+    else:
+        store = RollupStore(args.store)
+        print(f"{len(store.columns)} columns, tiers {', '.join(f'{tier} s' for tier in store.tiers)}")
+        for tier in store.tiers:
+            files = store.day_files(tier)
+            earliest = store.earliest(tier)
+            since = datetime.fromtimestamp(earliest).isoformat(sep=" ") if earliest is not None else "-"
+            print(f"  {tier:>5} s: {len(files)} day files, from {since}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+### Output segment rotation, retention and compaction for long-running (daemon) logging ###
+#
+# A rotated output is a series of segments next to the configured path, named
+# after the time each was opened:
+#   rapl_power_log.csv  ->  rapl_power_log-20261017T075300.csv, rapl_power_log-20261017T085300.csv, ...
+# Segment names sort in time order, so retention always removes the oldest ones.
+import glob
+import gzip
+import os
+import shutil
+import threading
+import time
+
+from columnar_output import compact_run
+
+STAMP_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def split_suffix(path):
+    """("dir/name", ".csv.gz") for "dir/name.csv.gz": everything from the first dot of the file name."""
+    directory, name = os.path.split(path)
+    stem, dot, suffix = name.partition(".")
+    return os.path.join(directory, stem), dot + suffix
+
+
+def segment_path(path, opened_at):
+    base, suffix = split_suffix(path)
+    candidate = f"{base}-{time.strftime(STAMP_FORMAT, time.localtime(opened_at))}"
+    result = candidate + suffix
+    n = 1
+    while os.path.exists(result) or glob.glob(glob.escape(result) + ".*"):
+        result = f"{candidate}.{n}{suffix}"  # Several rotations within one second
+        n += 1
+    return result
+
+
+def list_segments(path):
+    """Every segment of the rotated output path (compacted ones included), oldest first."""
+    base, _ = split_suffix(path)
+    return sorted(glob.glob(glob.escape(base) + "-" + "[0-9]" * 8 + "T" + "[0-9]" * 6 + "*"))
+
+
+def path_size(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class Retention:
+    """Which closed segments to delete: beyond max_count, older than max_age (s), or over max_bytes in total."""
+
+    def __init__(self, max_count=None, max_age=None, max_bytes=None):
+        self.max_count = max_count
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def apply(self, segments, keep=()):
+        """Delete expired segments (oldest first, never those in keep); return the deleted paths."""
+        candidates = [path for path in segments if path not in keep]
+        kept = len(segments) - len(candidates)
+        deleted = []
+        now = time.time()
+        if self.max_age is not None:
+            for path in candidates:
+                try:
+                    expired = now - os.path.getmtime(path) > self.max_age
+                except OSError:
+                    continue
+                if expired:
+                    deleted.append(path)
+        if self.max_count is not None:
+            alive = [path for path in candidates if path not in deleted]
+            excess = len(alive) + kept - self.max_count
+            deleted += alive[:max(excess, 0)]
+        if self.max_bytes is not None:
+            alive = [path for path in candidates if path not in deleted]
+            sizes = [path_size(path) for path in alive]
+            total = sum(sizes) + sum(path_size(path) for path in keep)
+            for path, size in zip(alive, sizes):
+                if total <= self.max_bytes:
+                    break
+                deleted.append(path)
+                total -= size
+        for path in deleted:
+            remove_path(path)
+        return deleted
+
+
+def compact_segment(path):
+    """Shrink a closed segment in place: gzip a plain CSV, merge the chunks of a .npyd run."""
+    if os.path.isdir(path):
+        compact_run(path)
+        return path
+    if path.endswith(".csv"):
+        with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + ".gz.tmp", path + ".gz")
+        os.remove(path)
+        return path + ".gz"
+    return path  # Already compressed
+
+
+class RotatingSink:
+    """A sink (CsvSink, NpyChunkWriter, ...) that starts a new segment by age, size or on request.
+
+    open_sink(path) creates the sink for one segment. Rotation, compaction and
+    retention run inside write(), i.e. on the background writer thread, so the
+    sampler never waits for them. reopen() may be called from a signal
+    handler, as may setting a shared reopen_event; the next write starts a
+    new segment.
+    """
+
+    def __init__(self, path, open_sink, rotate_seconds=None, rotate_bytes=None,
+                 retention=None, compact=False, reopen_event=None):
+        self.path = path
+        self.open_sink = open_sink
+        self.rotate_seconds = rotate_seconds
+        self.rotate_bytes = rotate_bytes
+        self.retention = retention
+        self.compact = compact
+        self.rotations = 0
+        self.deleted = 0
+        self._reopen = reopen_event if reopen_event is not None else threading.Event()
+        self._open()
+
+    def _open(self):
+        self.opened_at = time.time()
+        self.segment = segment_path(self.path, self.opened_at)
+        self.sink = self.open_sink(self.segment)
+
+    def reopen(self):
+        self._reopen.set()
+
+    def _due(self):
+        if self._reopen.is_set():
+            return True
+        if self.rotate_seconds and time.time() - self.opened_at >= self.rotate_seconds:
+            return True
+        return bool(self.rotate_bytes) and path_size(self.segment) >= self.rotate_bytes
+
+    def rotate(self):
+        self._reopen.clear()
+        self.sink.close()
+        closed = self.segment
+        self._open()
+        self.rotations += 1
+        if self.compact:
+            compact_segment(closed)
+        if self.retention is not None:
+            self.deleted += len(self.retention.apply(list_segments(self.path), keep=(self.segment,)))
+
+    def write(self, records):
+        if self._due():
+            self.rotate()
+        self.sink.write(records)
+
+    def close(self):
+        self.sink.close()
+        if self.compact:
+            compact_segment(self.segment)
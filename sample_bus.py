@@ -0,0 +1,183 @@
+### Shared-memory sample bus: one sampler publishes rows, any number of local processes read them ###
+#
+# The bus is a file in /dev/shm (tmpfs) that the sampler and every consumer
+# map. Layout (little-endian):
+#   offset  0  8 bytes  magic b"RAPLBUS1"
+#   offset  8  u32      format version (1)
+#   offset 12  u32      header size in bytes (slots start here, page aligned)
+#   offset 16  u64      slot size in bytes (8 + record size, rounded up to 8)
+#   offset 24  u64      capacity in slots
+#   offset 32  u64      published count: samples 0 .. count-1 have been published
+#   offset 40  u32      closed flag, set when the sampler exits
+#   offset 44  u32      length of the JSON schema that follows
+#   offset 48  ...      JSON {"fields": [[name, dtype, shape]...], "columns": [...]} (as in mmap_log.py)
+#   header size + (n % capacity) * slot size   slot of sample n:
+#       u64 sequence, then the record (Schema.dtype)
+#
+# Each slot is a seqlock. To publish sample n the sampler sets the slot's
+# sequence to 2n + 1 (odd: being written), copies the record, sets it to
+# 2n + 2 and only then bumps the published count. A reader copies a slot and
+# accepts it if the sequence was 2n + 2 both before and after the copy, so a
+# record overwritten mid-copy is discarded, never returned torn. Reads are
+# plain memory loads: no syscalls and no parsing, whatever the number of
+# readers. The ordering relies on stores becoming visible in program order,
+# which x86 (the RAPL platforms this logger targets) guarantees.
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from mmap_log import schema_json, schema_from_json
+
+MAGIC = b"RAPLBUS1"
+VERSION = 1
+COUNT_OFFSET = 32
+CLOSED_OFFSET = 40
+SCHEMA_OFFSET = 48
+DEFAULT_PATH = "/dev/shm/rapl-sample-bus"
+
+
+def slot_dtype(record_dtype):
+    size = -(-(8 + record_dtype.itemsize) // 8) * 8
+    return np.dtype({"names": ["seq", "record"], "formats": ["<u8", record_dtype],
+                     "offsets": [0, 8], "itemsize": size})
+
+
+class _Mapping:
+    """Shared header/slot views of a bus file."""
+
+    def _map(self, path, writable):
+        fd = os.open(path, os.O_RDWR if writable else os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            self.mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, version, header_size, _, capacity = struct.unpack_from("<8sIIQQ", self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} sample bus")
+        (schema_len,) = struct.unpack_from("<I", self.mm, 44)
+        self.schema = schema_from_json(bytes(self.mm[SCHEMA_OFFSET:SCHEMA_OFFSET + schema_len]))
+        self.capacity = capacity
+        self.count = np.ndarray((1,), dtype="<u8", buffer=self.mm, offset=COUNT_OFFSET)
+        self.closed_flag = np.ndarray((1,), dtype="<u4", buffer=self.mm, offset=CLOSED_OFFSET)
+        slots = np.ndarray((capacity,), dtype=slot_dtype(self.schema.dtype), buffer=self.mm, offset=header_size)
+        self.seq = slots["seq"]
+        self.records = slots["record"]
+
+    def _unmap(self):
+        # Drop the numpy views before unmapping
+        self.count = self.closed_flag = self.seq = self.records = None
+        self.mm.close()
+
+
+class SampleBus(_Mapping):
+    """Writer side, owned by the sampler: publish(row) copies one row into the next slot."""
+
+    def __init__(self, path, schema, capacity=1024):
+        self.path = path
+        meta = schema_json(schema)
+        header_size = -(-(SCHEMA_OFFSET + len(meta)) // mmap.PAGESIZE) * mmap.PAGESIZE
+        size = slot_dtype(schema.dtype).itemsize
+        header = struct.pack("<8sIIQQQII", MAGIC, VERSION, header_size, size, capacity, 0, 0, len(meta)) + meta
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.truncate(header_size + capacity * size)
+        os.replace(tmp_path, path)  # Readers only ever open a complete bus
+        self._map(path, writable=True)
+        self.published = 0
+
+    def publish(self, row):
+        n = self.published
+        slot = n % self.capacity
+        self.seq[slot] = 2 * n + 1
+        self.records[slot] = row
+        self.seq[slot] = 2 * n + 2
+        self.published = n + 1
+        self.count[0] = n + 1
+
+    def stats(self):
+        return f"Sample bus: {self.published} rows published on {self.path}"
+
+    def close(self):
+        self.closed_flag[0] = 1
+        self._unmap()
+        try:
+            os.remove(self.path)  # Mapped readers keep their view and see the closed flag
+        except OSError:
+            pass
+
+
+class SampleBusReader(_Mapping):
+    """Consumer side: the latest samples, or every sample since the previous call."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._map(path, writable=False)
+        self.position = int(self.count[0])  # read_new() starts with samples published from now on
+        self.lost = 0
+
+    @property
+    def closed(self):
+        return bool(self.closed_flag[0])
+
+    def _copy(self, first, end):
+        """Consistent copies of samples first .. end-1 (fewer if some were overwritten meanwhile)."""
+        # One slot of margin: the writer may be filling the slot after the published ones
+        first = max(first, end - (self.capacity - 1), 0)
+        if first >= end:
+            return np.zeros(0, dtype=self.schema.dtype)
+        numbers = np.arange(first, end, dtype=np.uint64)
+        slots = (numbers % np.uint64(self.capacity)).astype(np.intp)
+        expected = 2 * numbers + 2
+        before = self.seq[slots]
+        records = self.records[slots]
+        after = self.seq[slots]
+        return records[(before == expected) & (after == expected)]
+
+    def latest(self, n=1):
+        """Up to n most recent samples, oldest first."""
+        end = int(self.count[0])
+        return self._copy(end - n, end)
+
+    def read_new(self):
+        """Samples published since the previous call; samples overwritten before it are counted in lost."""
+        end = int(self.count[0])
+        records = self._copy(self.position, end)
+        self.lost += (end - self.position) - len(records)
+        self.position = end
+        return records
+
+    def close(self):
+        self._unmap()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print samples from the logger's shared-memory bus as CSV")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH, help="Bus file (default: %(default)s)")
+    parser.add_argument("-n", "--latest", type=int, default=1, help="Print the latest N samples and exit")
+    parser.add_argument("-f", "--follow", action="store_true", help="Keep printing new samples")
+    parser.add_argument("--poll", type=float, default=0.2, help="Follow poll interval in seconds")
+    args = parser.parse_args()
+
+    reader = SampleBusReader(args.path)
+    print(",".join(reader.schema.header))
+    print(reader.schema.format_csv(reader.latest(args.latest)), end="", flush=True)
+    try:
+        while args.follow:
+            time.sleep(args.poll)
+            print(reader.schema.format_csv(reader.read_new()), end="", flush=True)
+            if reader.closed:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+### Fixed-schema sample rows in a preallocated NumPy ring buffer, formatted only at flush time ###
+import io
+from datetime import datetime
+
+import numpy as np
+
+
+class Schema:
+    """Structured dtype of a sample row plus the CSV columns rendered from it.
+
+    A field holds one collector's values (a scalar or a per-CPU/per-domain
+    vector); text fields are fixed-width ASCII ("S") to keep records small. Columns map header names to (field, index) and carry a printf
+    format and the text written for NaN, e.g. "" for deltas that were not
+    sampled on that tick or "N/A" for unreadable files.
+    """
+
+    def __init__(self):
+        self.fields = [("timestamp", "f8", ())]
+        self.columns = []  # (header, field, index, fmt, na_rep)
+
+    def add_field(self, name, dtype, shape=()):
+        self.fields.append((name, dtype, shape))
+
+    def add_column(self, header, field, index=None, fmt="%s", na_rep=""):
+        self.columns.append((header, field, index, fmt, na_rep))
+
+    @property
+    def dtype(self):
+        return np.dtype([(name, dtype, shape) for name, dtype, shape in self.fields])
+
+    @property
+    def header(self):
+        return ["Timestamp"] + [column[0] for column in self.columns]
+
+    def new_row(self):
+        """A zeroed single-record array collectors write into in place."""
+        row = np.zeros((), dtype=self.dtype)
+        for name, dtype, _ in self.fields:
+            if np.dtype(dtype).kind == "f":
+                row[name] = np.nan
+        return row
+
+    def format_csv(self, records):
+        """Render records (a structured array) as CSV lines, without the header."""
+        if len(records) == 0:
+            return ""
+        columns = [np.array([datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                             for t in records["timestamp"].tolist()], dtype=object)]
+        for _, field, index, fmt, na_rep in self.columns:
+            values = records[field] if index is None else records[field][:, index]
+            if values.dtype.kind == "f":
+                text = np.char.mod(fmt, values).astype(object)
+                text[np.isnan(values)] = na_rep
+            else:
+                text = values.astype(str).astype(object)
+            columns.append(text)
+        lines = [",".join(line) for line in np.column_stack(columns).tolist()]
+        return "\n".join(lines) + "\n"
+
+
+class SampleRing:
+    """Preallocated ring of structured rows; append() copies one row in place."""
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.written = 0  # Rows appended since creation
+        self.flushed = 0  # Rows handed out by take_pending()
+
+    def append(self, row):
+        self.data[self.written % self.capacity] = row
+        self.written += 1
+
+    @property
+    def pending(self):
+        return self.written - self.flushed
+
+    def take_pending(self):
+        """Copy out every row not yet taken, oldest first (rows overwritten before that are lost)."""
+        start = max(self.flushed, self.written - self.capacity)
+        indices = np.arange(start, self.written) % self.capacity
+        self.flushed = self.written
+        return self.data[indices]
+
+
+def compressed_path(path, compression):
+    suffix = {"gzip": ".gz", "zstd": ".zst"}.get(compression)
+    if suffix and not path.endswith(suffix):
+        return path + suffix
+    return path
+
+
+def open_text(path, compression=None):
+    """Open path for text writing, optionally through gzip or zstd streaming compression."""
+    if compression in (None, "none"):
+        return open(path, "w")
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, "wt", compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit("zstd compression needs the 'zstandard' package (pip install zstandard)")
+        raw = open(path, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=3).stream_writer(raw), encoding="utf-8")
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+class CsvSink:
+    """Writes flushed records to a CSV file, header first, optionally gzip/zstd compressed."""
+
+    def __init__(self, path, schema, compression=None):
+        self.path = path
+        self.schema = schema
+        self.f = open_text(path, compression)
+        self.f.write(",".join(schema.header) + "\n")
+        self.f.flush()
+
+    def write(self, records):
+        self.f.write(self.schema.format_csv(records))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class TeeSink:
+    """Hands every flushed chunk to several sinks in turn, e.g. the output file and a rollup store."""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, records):
+        for sink in self.sinks:
+            sink.write(records)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,100 @@
+### Sweep planning: orders sweep configurations so consecutive runs differ as little as possible ###
+#
+# C-state subsets are walked in reflected Gray code order, so each run toggles
+# exactly one state (one disable file per CPU) relative to the previous one.
+# Successive governor/EPP blocks walk that sequence alternately forwards and
+# backwards (serpentine order), so a block starts with the subset the previous
+# block ended with, and EPP values within a governor are ordered to end next
+# to where the following governor starts.
+#
+#   python3 sweep_plan.py            # compare transitions against the lexicographic order
+import argparse
+from itertools import combinations
+
+# intel_pstate EPP values from most to least performance oriented
+EPP_ORDER = ['performance', 'balance_performance', 'default', 'balance_power', 'power']
+
+
+def gray_subsets(items):
+    """Every non-empty subset of items (as tuples in items order); consecutive subsets differ by one item."""
+    for i in range(1, 1 << len(items)):
+        code = i ^ (i >> 1)
+        yield tuple(item for bit, item in enumerate(items) if code >> bit & 1)
+
+
+def _rank(value, order):
+    return order.index(value) if value in order else len(order)
+
+
+def order_active_blocks(governor_modes, epp_order=EPP_ORDER):
+    """[(governor, epp)] with each governor's EPP values oriented to end nearest the next governor's first."""
+    governors = list(governor_modes)
+    oriented = {}
+    following = None
+    for governor in reversed(governors):
+        prefs = list(governor_modes[governor])
+        if following is not None and len(prefs) > 1:
+            target = _rank(following, epp_order)
+            if abs(_rank(prefs[0], epp_order) - target) < abs(_rank(prefs[-1], epp_order) - target):
+                prefs.reverse()
+        oriented[governor] = prefs
+        following = prefs[0]
+    return [(governor, pref) for governor in governors for pref in oriented[governor]]
+
+
+def plan_sweep(cstates, active_modes, passive_governors):
+    """[(mode, governor, epp or None, enabled C-states)] for the full sweep, in serpentine Gray code order."""
+    blocks = [("ACTIVE", governor, pref) for governor, pref in order_active_blocks(active_modes)]
+    blocks += [("PASSIVE", governor, None) for governor in passive_governors]
+    subsets = list(gray_subsets(cstates))
+    plan = []
+    for k, (mode, governor, pref) in enumerate(blocks):
+        for subset in subsets if k % 2 == 0 else reversed(subsets):
+            plan.append((mode, governor, pref, subset))
+    return plan
+
+
+def lexicographic_plan(cstates, active_modes, passive_governors):
+    """The previous order: per block, single states, then itertools.combinations by size."""
+    subsets = [(state,) for state in cstates]
+    subsets += [combo for r in range(2, len(cstates) + 1) for combo in combinations(cstates, r)]
+    blocks = [("ACTIVE", governor, pref) for governor, prefs in active_modes.items() for pref in prefs]
+    blocks += [("PASSIVE", governor, None) for governor in passive_governors]
+    return [(mode, governor, pref, subset) for mode, governor, pref in blocks for subset in subsets]
+
+
+def transitions(plan, cstates):
+    """(C-state toggles, governor changes, EPP changes, mode changes) needed to walk plan in order."""
+    toggles = governor_changes = epp_changes = mode_changes = 0
+    previous = None
+    for mode, governor, pref, subset in plan:
+        if previous is None:
+            previous = (mode, governor, pref, set(cstates))  # Everything enabled to start with
+        prev_mode, prev_governor, prev_pref, prev_subset = previous
+        toggles += len(set(subset) ^ set(prev_subset))
+        mode_changes += mode != prev_mode
+        governor_changes += governor != prev_governor
+        epp_changes += pref is not None and pref != prev_pref
+        previous = (mode, governor, pref, subset)
+    return toggles, governor_changes, epp_changes, mode_changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the sweep order and the transitions it needs")
+    parser.add_argument("--list", action="store_true", help="Print every configuration in order")
+    args = parser.parse_args()
+
+    from dataset_logic_full_combination import C_STATES, P_STATES_ACTIVE_GOVERNOR_MODES, PASSIVE_GOVERNORS
+    axes = (C_STATES, P_STATES_ACTIVE_GOVERNOR_MODES, PASSIVE_GOVERNORS)
+    plan = plan_sweep(*axes)
+    if args.list:
+        for mode, governor, pref, subset in plan:
+            print(mode, governor, pref or "-", "+".join(subset))
+    for name, candidate in [("lexicographic", lexicographic_plan(*axes)), ("serpentine Gray", plan)]:
+        toggles, governors, epps, modes = transitions(candidate, C_STATES)
+        print(f"{name:>16}: {len(candidate)} runs, {toggles} C-state toggles "
+              f"({toggles / len(candidate):.2f} per run), {governors} governor, {epps} EPP, {modes} mode changes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+### Sequential statistics for sweep runs: settle before a run, end it once its means are known well enough ###
+#
+# Both are Sampler.run() monitors: begin(schema) before the first row, then
+# update(row) for every row until it returns True.
+#
+# Samples of one run are autocorrelated (power follows the workload and the
+# thermal state), so the confidence interval is computed from non-overlapping
+# batch means rather than from the raw samples. A run stops once, for every
+# gating series, the interval's half-width is at most its tolerance times the
+# mean, bounded below by a minimum duration; the caller's run duration is the
+# upper bound. Benchmark latency is far noisier than package power, so it only
+# gates with its own tolerance and is otherwise just reported.
+#
+# Settling replaces a fixed pause between configurations: the sampler runs
+# without recording until package power and temperature stop drifting.
+import math
+import time
+from collections import deque
+from statistics import NormalDist
+
+import numpy as np
+
+from rapl_domains import package_domain_slots
+
+
+def t_quantile(p, dof):
+    """Student t quantile (Cornish-Fisher expansion around the normal; within 1 % for dof >= 3)."""
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * dof) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+
+
+def package_power_slots(schema):
+    """Indices of the top-level package domains in the rapl_w field (sub-domains would double count)."""
+    columns = [(header[:-len(" (W)")], index) for header, field, index, _, _ in schema.columns if field == "rapl_w"]
+    return np.array([columns[i][1] for i in package_domain_slots([name for name, _ in columns])], dtype=np.intp)
+
+
+class BatchMeans:
+    """Mean and confidence interval of a series from the means of consecutive batch_seconds-long batches."""
+
+    def __init__(self, batch_seconds=1.0):
+        self.batch_seconds = batch_seconds
+        self.means = []
+        self.start = None
+        self.batch = None
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value, t):
+        if self.start is None:
+            self.start = t
+        batch = int((t - self.start) // self.batch_seconds)
+        if batch != self.batch:
+            if self.count:
+                self.means.append(self.total / self.count)
+            self.batch, self.total, self.count = batch, 0.0, 0
+        self.total += value
+        self.count += 1
+
+    def interval(self, confidence=0.95):
+        """(mean, half-width) over the completed batches, or None with fewer than two."""
+        n = len(self.means)
+        if n < 2:
+            return None
+        means = np.array(self.means)
+        half_width = t_quantile(0.5 + confidence / 2, n - 1) * means.std(ddof=1) / math.sqrt(n)
+        return float(means.mean()), float(half_width)
+
+
+class ConvergenceMonitor:
+    """Watches package power and the benchmark latency of a sampler run and says when the run may stop.
+
+    begin(schema) starts a run; update(row) is called with every emitted row
+    and returns True once the run has lasted min_duration and every gating
+    series has at least min_batches batches with a relative half-width within
+    its tolerance: `tolerance` for package power, `latency_tolerance` for
+    benchmark latency (None: latency is tracked for the summary only).
+    """
+
+    def __init__(self, tolerance, confidence=0.95, min_duration=5.0, batch_seconds=1.0, min_batches=5,
+                 latency_tolerance=None):
+        self.tolerance = tolerance
+        self.latency_tolerance = latency_tolerance
+        self.confidence = confidence
+        self.min_duration = min_duration
+        self.batch_seconds = batch_seconds
+        self.min_batches = min_batches
+
+    def begin(self, schema):
+        self.series = {}  # name -> (field, indices or None, tolerance or None)
+        fields = {name for name, _, _ in schema.fields}
+        packages = package_power_slots(schema)
+        if len(packages):
+            self.series["package power"] = ("rapl_w", packages, self.tolerance)
+        if "latency_ms" in fields:
+            self.series["benchmark latency"] = ("latency_ms", None, self.latency_tolerance)
+        self.batches = {name: BatchMeans(self.batch_seconds) for name in self.series}
+        self.first = None
+        self.elapsed = 0.0
+        self.converged = False
+
+    def update(self, row):
+        t = float(row["timestamp"])
+        if self.first is None:
+            self.first = t
+        self.elapsed = t - self.first
+        for name, (field, indices, _) in self.series.items():
+            value = float(row[field][indices].sum() if indices is not None else row[field])
+            if not math.isnan(value):  # Not sampled on this tick
+                self.batches[name].add(value, t)
+        if self.elapsed < self.min_duration:
+            return False
+        self.converged = all(self._within_tolerance(self.batches[name], tolerance)
+                             for name, (_, _, tolerance) in self.series.items() if tolerance is not None)
+        return self.converged
+
+    def _within_tolerance(self, batches, tolerance):
+        if len(batches.means) < self.min_batches:
+            return False
+        mean, half_width = batches.interval(self.confidence)
+        return half_width <= tolerance * abs(mean)
+
+    def summary(self):
+        parts = []
+        for name, batches in self.batches.items():
+            interval = batches.interval(self.confidence)
+            if interval is None:
+                parts.append(f"{name} n/a")
+            else:
+                mean, half_width = interval
+                relative = 100 * half_width / abs(mean) if mean else 0
+                gating = "" if self.series[name][2] is not None else ", not gating"
+                parts.append(f"{name} {mean:.3f} +/- {half_width:.3f} ({relative:.1f} %{gating})")
+        state = "converged" if self.converged else "not converged"
+        return f"Early stopping: {state} after {self.elapsed:.1f} s; {self.confidence:.0%} CI " + ", ".join(parts)
+
+
+class SettleDetector:
+    """Waits for steady state after a configuration change, before the measured run starts.
+
+    Over the last `window` seconds, the fitted drift of package power must be
+    within power_drift of its mean and the package temperature (if sampled)
+    must change by at most temp_rate degrees C per second.
+    """
+
+    def __init__(self, window=3.0, power_drift=0.03, temp_rate=0.1):
+        self.window = window
+        self.power_drift = power_drift
+        self.temp_rate = temp_rate
+
+    def begin(self, schema):
+        self.packages = package_power_slots(schema)
+        self.has_temp = "temp_c" in {name for name, _, _ in schema.fields}
+        self.samples = deque()  # (t, power, temperature)
+        self.start = time.time()  # Row timestamps are wall clock
+        self.elapsed = 0.0
+        self.settled = False
+        self.drift = self.slope = math.nan
+
+    def update(self, row):
+        t = float(row["timestamp"])
+        self.elapsed = t - self.start
+        power = float(row["rapl_w"][self.packages].sum())
+        temp = float(row["temp_c"]) if self.has_temp else math.nan
+        if math.isnan(power):
+            return False
+        self.samples.append((t, power, temp))
+        # Keep the window just covered: drop the oldest sample only while the next one is old enough
+        while len(self.samples) > 1 and self.samples[1][0] <= t - self.window:
+            self.samples.popleft()
+        if len(self.samples) < 3 or t - self.samples[0][0] < self.window:
+            return False
+        times, powers, temps = np.array(self.samples).T
+        times -= times[0]
+        mean = powers.mean()
+        self.drift = abs(np.polyfit(times, powers, 1)[0]) * self.window / abs(mean) if mean else math.nan
+        settled = self.drift <= self.power_drift
+        if self.has_temp and not np.isnan(temps).any():
+            self.slope = abs(np.polyfit(times, temps, 1)[0])
+            settled = settled and self.slope <= self.temp_rate
+        self.settled = settled
+        return settled
+
+    def summary(self):
+        state = "settled" if self.settled else "not settled"
+        return (f"Settle: {state} after {self.elapsed:.1f} s; power drift {100 * self.drift:.1f} % per "
+                f"{self.window:g} s, temperature slope {self.slope:.3f} C/s")
@@ -0,0 +1,89 @@
+### Persistent file-descriptor pool for sysfs/procfs attributes read on every sampling tick ###
+import os
+
+
+class SysfsFilePool:
+    """Opens each attribute once and re-reads it with pread at offset 0.
+
+    sysfs regenerates an attribute's contents on every read from offset 0, so
+    the descriptor can stay open for the whole run. A file is only reopened
+    when a read fails, e.g. after CPU hotplug removed and re-added it.
+    """
+
+    def __init__(self, read_size=4096):
+        self.read_size = read_size
+        self.fds = {}
+        self.syscalls = 0  # open/pread/close issued through the pool
+
+    def _open(self, path):
+        self.syscalls += 1
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        self.fds[path] = fd
+        return fd
+
+    def _pread(self, fd):
+        self.syscalls += 1
+        return os.pread(fd, self.read_size, 0)
+
+    def discard(self, path):
+        fd = self.fds.pop(path, None)
+        if fd is not None:
+            self.syscalls += 1
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def read_bytes(self, path):
+        """Return the raw contents of path, or None if it cannot be read."""
+        fd = self.fds.get(path)
+        if fd is not None:
+            try:
+                return self._pread(fd)
+            except OSError:
+                # Stale descriptor (device went away); fall through and reopen
+                self.discard(path)
+        try:
+            return self._pread(self._open(path))
+        except OSError:
+            self.discard(path)
+            return None
+
+    def readinto(self, path, buffer):
+        """pread path into a preallocated buffer in one syscall; return the byte count or None."""
+        fd = self.fds.get(path)
+        for attempt in range(2):
+            try:
+                if fd is None:
+                    fd = self._open(path)
+                self.syscalls += 1
+                return os.preadv(fd, [buffer], 0)
+            except OSError:
+                self.discard(path)
+                fd = None
+        return None
+
+    def read(self, path):
+        data = self.read_bytes(path)
+        if data is None:
+            return None
+        return data.decode(errors="replace").strip()
+
+    def read_int(self, path):
+        data = self.read_bytes(path)
+        if data is None:
+            return None
+        try:
+            return int(data)
+        except ValueError:
+            return None
+
+    def close(self):
+        for path in list(self.fds):
+            self.discard(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from mmap_log import MmapLogReader, MmapSegmentLog, read_log
+from sample_store import Schema
+
+
+def make_schema(latency=False):
+    schema = Schema()
+    schema.add_field("value", "i8")
+    schema.add_column("Value", "value")
+    if latency:
+        schema.add_field("latency_ms", "f8")
+        schema.add_column("Benchmark_Latency_ms", "latency_ms")
+    return schema
+
+
+def write_rows(log, schema, values):
+    row = schema.new_row()
+    for value in values:
+        row["value"] = value
+        log.append(row)
+
+
+def test_read_across_run_boundary(tmp_path):
+    prefix = str(tmp_path / "run")
+    schema = make_schema()
+    first = MmapSegmentLog(prefix, schema, segment_rows=8)
+    write_rows(first, schema, range(20))  # Last segment left partly filled
+    first.close()
+    second = MmapSegmentLog(prefix, schema, segment_rows=8)
+    write_rows(second, schema, range(20, 30))
+    second.close()
+
+    records, _ = read_log(prefix)
+    assert records["value"].tolist() == list(range(30))
+
+
+def test_follow_continues_after_killed_run(tmp_path):
+    prefix = str(tmp_path / "run")
+    schema = make_schema()
+    killed = MmapSegmentLog(prefix, schema, segment_rows=8)
+    write_rows(killed, schema, range(5))  # Never closed, so its segment is not sealed
+    killed.segment.close()
+
+    reader = MmapLogReader(prefix)
+    assert reader.read_new()["value"].tolist() == list(range(5))
+    restarted = MmapSegmentLog(prefix, schema, segment_rows=8)
+    write_rows(restarted, schema, range(5, 12))
+    assert reader.read_new()["value"].tolist() == list(range(5, 12))
+    restarted.close()
+    reader.close()
+
+
+def test_different_schema_is_refused(tmp_path):
+    prefix = str(tmp_path / "run")
+    schema = make_schema()
+    log = MmapSegmentLog(prefix, schema, segment_rows=8)
+    write_rows(log, schema, range(3))
+    log.close()
+
+    with pytest.raises(ValueError):
+        MmapSegmentLog(prefix, make_schema(latency=True), segment_rows=8)
+    records, read_schema = read_log(prefix)
+    assert records["value"].tolist() == [0, 1, 2]
+    assert "latency_ms" not in np.dtype(read_schema.dtype).names